@@ -0,0 +1,431 @@
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from search_loader import load_search_module
+
+
+# -----------------------------
+# Search benchmark / recall harness
+# -----------------------------
+# Generates a synthetic dental-conversation corpus, runs a query set against
+# every search mode and reports p50/p95/p99 latency, throughput, peak RSS and
+# recall@k against exact brute-force cosine search.
+#
+#   python benchmark.py --messages 20000 --queries 200
+#       seeds the Postgres from search-script.py's DB_CONFIG (rows are tagged
+#       with a dedicated tenant and removed again unless --keep), builds every
+#       index into a temp dir and benchmarks all modes. The schema is never
+#       migrated here: it must already be set up (`search-script.py --setup`)
+#       or the run stops before seeding.
+#
+#   python benchmark.py --dsn "dbname=rag_bench" [--setup]
+#       same against a scratch database; --setup runs the search-script.py
+#       migrations (tsvector/trigram indexes, vector column, ANN index,
+#       embedding backfill) on the database benchmarked, and is implied by --dsn
+#
+#   python benchmark.py --no-db --messages 100000
+#       no database: benchmarks the in-process engines (BM25, TF-IDF, the
+#       embedding store in float32 and each quantization) on the generated
+#       corpus. SQLite cannot stand in for the Postgres modes, which rely on
+#       tsvector, pgvector, md5() and ANY().
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DB_MODES = ("keyword", "tfidf", "bm25", "neural", "vector", "hybrid", "ltr")
+# Also accepted by --modes, not run by default
+EXTRA_DB_MODES = ("streaming",)
+MEMORY_MODES = ("tfidf", "bm25", "neural", "neural-float16", "neural-int8", "neural-binary")
+# Modes ranking canonical rows by embedding similarity: recall@k is measured
+# against exact cosine top-k over the whole table
+RECALL_MODES = ("neural", "semantic", "vector", "hybrid", "ltr", "streaming",
+                "neural-float16", "neural-int8", "neural-binary")
+
+SYMPTOMS = [
+    "tooth pain", "sharp pain", "dull ache", "swollen gum", "bleeding gums", "sensitivity to cold",
+    "sensitivity to sweets", "jaw pain", "loose filling", "broken crown", "bad breath", "abscess",
+    "wisdom tooth", "cracked molar", "dry socket", "toothache at night",
+]
+TEETH = ["lower left molar", "upper right molar", "front incisor", "canine", "premolar", "tooth #36", "tooth #14"]
+TREATMENTS = [
+    "root canal", "x-ray", "filling", "extraction", "cleaning", "crown", "painkillers", "ibuprofen",
+    "antibiotics", "local anesthesia", "follow-up visit", "whitening",
+]
+PATIENT_TEMPLATES = [
+    "Doctor, I have {symptom} in my {tooth}.",
+    "The {symptom} started {days} days ago and gets worse at night.",
+    "Is a {treatment} painful? I am worried about the {symptom}.",
+    "I took {treatment} but the {symptom} still comes back.",
+    "Can we schedule the {treatment} for my {tooth}?",
+]
+DENTIST_TEMPLATES = [
+    "Sounds like your {tooth} may need a {treatment}.",
+    "{symptom} usually indicates decay; we should do an {treatment} first.",
+    "We will use local anesthesia, so the {treatment} will not hurt.",
+    "Please avoid cold drinks until the {treatment} on your {tooth}.",
+    "The {treatment} takes about {days} hours depending on complexity.",
+]
+
+
+# -----------------------------
+# Synthetic data
+# -----------------------------
+def _fill(rng, template):
+    return template.format(
+        symptom=rng.choice(SYMPTOMS), tooth=rng.choice(TEETH), treatment=rng.choice(TREATMENTS),
+        days=rng.randint(1, 9),
+    )
+
+
+def generate_corpus(n, seed=0, langs=("en", "en", "en", "de")):
+    # -> [(role, text, lang)], alternating patient / dentist turns
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        role = "user" if i % 2 == 0 else "assistant"
+        templates = PATIENT_TEMPLATES if role == "user" else DENTIST_TEMPLATES
+        corpus.append((role, _fill(rng, rng.choice(templates)), rng.choice(langs)))
+    return corpus
+
+
+def generate_queries(n, seed=1):
+    rng = random.Random(seed)
+    shapes = [
+        lambda: rng.choice(SYMPTOMS),
+        lambda: f"{rng.choice(SYMPTOMS)} {rng.choice(TEETH)}",
+        lambda: f"{rng.choice(TREATMENTS)} for {rng.choice(SYMPTOMS)}",
+        lambda: f"how long does a {rng.choice(TREATMENTS)} take",
+    ]
+    return [rng.choice(shapes)() for _ in range(n)]
+
+
+# -----------------------------
+# Measurement
+# -----------------------------
+def reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM to the current RSS, so the
+    # next peak_rss_mb() is the peak of this mode alone
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    # Elsewhere only the whole-process peak is available (KiB on Linux, bytes on macOS)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2 ** 20 if sys.platform == "darwin" else maxrss / 1024.0
+
+
+def run_mode(fn, queries, warmup=3, concurrency=1):
+    for q in queries[:warmup]:
+        fn(q)
+
+    def timed(q):
+        start = time.perf_counter()
+        result = fn(q)
+        return time.perf_counter() - start, result
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            timings = list(executor.map(timed, queries))
+    else:
+        timings = [timed(q) for q in queries]
+    wall = time.perf_counter() - started
+    latencies = np.array([t for t, _ in timings]) * 1000.0
+    return latencies, [r for _, r in timings], wall
+
+
+def recall_at_k(results, truth, k):
+    hits = [len({r[0] for r in found[:k]} & set(expected[:k])) / max(min(k, len(expected)), 1)
+            for found, expected in zip(results, truth) if expected]
+    return float(np.mean(hits)) if hits else None
+
+
+def summarize(mode, latencies, wall, n_queries, recall=None, index_bytes=None):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {
+        "mode": mode,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "qps": round(n_queries / wall, 1) if wall else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "index_mb": None if index_bytes is None else round(index_bytes / 2 ** 20, 2),
+        "recall_at_k": None if recall is None else round(recall, 4),
+    }
+
+
+def print_report(rows, k):
+    header = ("mode", "p50_ms", "p95_ms", "p99_ms", "qps", "peak_rss_mb", "index_mb", "recall_at_k")
+    print(" | ".join(h.replace("recall_at_k", f"recall@{k}") for h in header))
+    for row in rows:
+        print(" | ".join("-" if row[h] is None else str(row[h]) for h in header))
+
+
+# -----------------------------
+# Postgres backend
+# -----------------------------
+def seed_postgres(conn, corpus):
+    from psycopg2.extras import execute_values
+
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO te_ai_tenant (tnt_name) VALUES (%s) RETURNING tnt_id", ("benchmark",))
+        tnt_id = cur.fetchone()[0]
+        tntu_id = str(uuid.uuid4())
+        cur.execute("INSERT INTO te_ai_tenant_user (tntu_id, tntu_tnt_id, tntu_u_id) VALUES (%s, %s, %s)",
+                    (tntu_id, tnt_id, 0))
+        cur.execute("""
+            INSERT INTO te_ai_project (pro_tntu_id, pro_title, pro_created)
+            VALUES (%s, %s, %s) RETURNING pro_id
+        """, (tntu_id, "benchmark", datetime.now().time()))
+        pro_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO te_ai_chat (cht_pro_id, cht_created) VALUES (%s, %s) RETURNING cht_id",
+                    (pro_id, datetime.now()))
+        cht_id = cur.fetchone()[0]
+        roles = {}
+        for code, name in (("user", "Patient"), ("assistant", "Dentist")):
+            cur.execute("""
+                INSERT INTO te_ai_message_role (msgrole_code, msgrole_display_name)
+                VALUES (%s, %s) RETURNING msgrole_id
+            """, (code, name))
+            roles[code] = cur.fetchone()[0]
+        cur.execute("INSERT INTO te_ai_message_status (msgsts_name) VALUES (%s) RETURNING msgsts_id", ("completed",))
+        msgsts_id = cur.fetchone()[0]
+
+        msg_ids = execute_values(cur, """
+            INSERT INTO te_ai_message (msg_cht_id, msg_msgrole_id, msg_content_text, msg_msgsts_id)
+            VALUES %s RETURNING msg_id
+        """, [(cht_id, roles[role], text, msgsts_id) for role, text, _ in corpus], page_size=1000, fetch=True)
+        execute_values(cur, """
+            INSERT INTO te_ai_canonical_data (
+                cantxt_tntu_id, cantxt_type, cantxt_source_id,
+                cantxt_content_text, cantxt_lang, cantxt_n_tokens, cantxt_pii_level, cantxt_srctyp_id
+            ) VALUES %s
+        """, [
+            (tntu_id, "text", msg_id[0], text, lang, len(text.split()), "low", 1)
+            for msg_id, (_, text, lang) in zip(msg_ids, corpus)
+        ], page_size=1000)
+    conn.commit()
+    return {"tnt_id": tnt_id, "tntu_id": tntu_id, "pro_id": pro_id, "cht_id": cht_id,
+            "roles": list(roles.values()), "msgsts_id": msgsts_id}
+
+
+def missing_schema(conn, search):
+    # What search-script.py --setup would still have to create
+    from ingest import column_exists
+
+    missing = [f"{table}.{tsv_col}" for table, (_, tsv_col) in search.fulltext_index.TABLES.items()
+               if not column_exists(conn, table, tsv_col)]
+    table, column = search.pgvector_index.TABLE, search.pgvector_index.COLUMN
+    if not column_exists(conn, table, column):
+        missing.append(f"{table}.{column}")
+    elif not any(index["valid"] for index in search.pgvector_index.index_status(conn)):
+        missing.append(f"ANN index on {table}.{column}")
+    return missing
+
+
+def embed_seeded(conn, search, seeded):
+    # Without --setup there is no backfill, so only the benchmark's own rows
+    # get their embeddings written
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT cantxt_id, cantxt_content_text FROM {search.pgvector_index.TABLE}
+            WHERE cantxt_tntu_id = %s AND {search.pgvector_index.COLUMN} IS NULL ORDER BY cantxt_id
+        """, (seeded["tntu_id"],))
+        rows = cur.fetchall()
+        if rows:
+            vectors = search.model.encode([r[1] or "" for r in rows], batch_size=256,
+                                          convert_to_numpy=True, normalize_embeddings=True)
+            search.pgvector_index.write_embeddings(cur, [r[0] for r in rows], vectors)
+    conn.commit()
+
+
+def cleanup_postgres(conn, seeded):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM te_ai_canonical_data WHERE cantxt_tntu_id = %s", (seeded["tntu_id"],))
+        cur.execute("DELETE FROM te_ai_message WHERE msg_cht_id = %s", (seeded["cht_id"],))
+        cur.execute("DELETE FROM te_ai_chat WHERE cht_id = %s", (seeded["cht_id"],))
+        cur.execute("DELETE FROM te_ai_project WHERE pro_id = %s", (seeded["pro_id"],))
+        cur.execute("DELETE FROM te_ai_tenant_user WHERE tntu_id = %s", (seeded["tntu_id"],))
+        cur.execute("DELETE FROM te_ai_tenant WHERE tnt_id = %s", (seeded["tnt_id"],))
+        cur.execute("DELETE FROM te_ai_message_role WHERE msgrole_id = ANY(%s)", (seeded["roles"],))
+        cur.execute("DELETE FROM te_ai_message_status WHERE msgsts_id = %s", (seeded["msgsts_id"],))
+    conn.commit()
+
+
+def bench_postgres(args, corpus, queries):
+    import psycopg2.extensions
+
+    search = load_search_module()
+    from embedding_store import EmbeddingStore
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    # Never touch the real on-disk indexes
+    search.EMBEDDING_STORE_PATH = os.path.join(workdir, "embedding_store")
+    search.TFIDF_INDEX_PATH = os.path.join(workdir, "tfidf_index")
+    search.BM25_INDEX_PATH = os.path.join(workdir, "bm25_index")
+    if args.dsn:
+        search.DB_CONFIG = psycopg2.extensions.parse_dsn(args.dsn)
+
+    conn = search.get_connection()
+    if not args.setup:
+        missing = missing_schema(conn, search)
+        if missing:
+            conn.close()
+            raise SystemExit(f"schema not set up ({', '.join(missing)}): run `search-script.py --setup` "
+                             "first, or benchmark a scratch database with --dsn / --setup")
+    seeded = seed_postgres(conn, corpus) if not args.skip_seed else None
+    try:
+        if args.setup:
+            search.setup_fulltext_indexes()
+            search.setup_vector_index(backfill=True)
+        elif seeded is not None:
+            embed_seeded(conn, search, seeded)
+        search.warm_up()
+
+        k = args.k
+        query_embs = search.encode_queries(queries)
+        # Exact truth from the float32 rows, whatever EMBEDDING_STORE_CONFIG quantizes to
+        store = search.get_embedding_store()
+        exact = EmbeddingStore.from_arrays(store.embeddings, store.ids, search.MODEL_NAME)
+        truth = [[i for i, _ in hits] for hits in exact.search_many(query_embs, k=k)]
+        modes = {
+            "keyword": lambda q: search.keyword_search(q, limit=k),
+            "tfidf": lambda q: search.tfidf_search(q, k=k),
+            "bm25": lambda q: search.bm25_search(q, k=k),
+            "neural": lambda q: search.neural_search(q, k=k, lang=None),
+            "vector": lambda q: search.vector_search(search.encode_query(q), k=k),
+            "hybrid": lambda q: search.hybrid_search(q, lang=None, k=k),
+            "ltr": lambda q: search.ltr_search(q, k=k, lang="en"),
+            "streaming": lambda q: search.neural_search_streaming(q, k=k, lang=None),
+        }
+        report = []
+        for mode in args.modes:
+            # Measure the engines, not the result cache
+            search.result_cache.bump_version()
+            reset_peak_rss()
+            latencies, results, wall = run_mode(modes[mode], queries, args.warmup, args.concurrency)
+            recall = recall_at_k(results, truth, k) if mode in RECALL_MODES else None
+            report.append(summarize(mode, latencies, wall, len(queries), recall))
+        return report
+    finally:
+        if seeded is not None and not args.keep:
+            cleanup_postgres(conn, seeded)
+        conn.close()
+
+
+# -----------------------------
+# In-process backend (no database)
+# -----------------------------
+def bench_memory(args, corpus, queries):
+    sys.path.insert(0, HERE)
+    from bm25_index import BM25Index
+    from embedding_store import EmbeddingStore
+    from tfidf_index import TfidfIndex
+    from topk import top_k_rows
+
+    k = args.k
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    rows = [(i, text, lang) for i, (_, text, lang) in enumerate(corpus)]
+    engines, index_bytes = {}, {}
+
+    if "bm25" in args.modes:
+        bm25 = BM25Index(os.path.join(workdir, "bm25"))
+        bm25.build_from_rows([(i, text, None) for i, text, _ in rows])
+        engines["bm25"] = lambda q: bm25.search(q, k=k)
+    if "tfidf" in args.modes:
+        tfidf = TfidfIndex(os.path.join(workdir, "tfidf"))
+        tfidf.fit_rows([(i, text) for i, text, _ in rows])
+        engines["tfidf"] = lambda q: tfidf.search(q, k=k)
+
+    truth = [[] for _ in queries]
+    neural_modes = [m for m in args.modes if m.startswith("neural")]
+    if neural_modes:
+        from encoder import Encoder
+
+        encoder = Encoder(args.model).warm_up()
+        embeddings = encoder.encode([t for _, t, _ in rows], batch_size=256, convert_to_numpy=True,
+                                    normalize_embeddings=True).astype(np.float32)
+        query_embs = encoder.encode(queries, convert_to_numpy=True, normalize_embeddings=True)
+        truth = [idx.tolist() for idx, _ in top_k_rows(query_embs @ embeddings.T, k)]
+
+        # "neural" is the float32 store, "neural-<q>" the same rows quantized
+        for mode in neural_modes:
+            quantization = mode.partition("-")[2] or "float32"
+            store = EmbeddingStore.from_arrays(embeddings, np.arange(len(rows)), args.model,
+                                               quantization=quantization)
+            index_bytes[mode] = store.nbytes
+
+            def neural(q, store=store):
+                return store.search(encoder.encode(q, convert_to_numpy=True, normalize_embeddings=True), k=k)
+
+            engines[mode] = neural
+
+    report = []
+    for mode in args.modes:
+        reset_peak_rss()
+        latencies, results, wall = run_mode(engines[mode], queries, args.warmup, args.concurrency)
+        recall = recall_at_k(results, truth, k) if mode in RECALL_MODES else None
+        report.append(summarize(mode, latencies, wall, len(queries), recall, index_bytes.get(mode)))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark rag-search modes on a synthetic corpus")
+    parser.add_argument("--messages", type=int, default=10000, help="synthetic messages to generate")
+    parser.add_argument("--queries", type=int, default=200, help="queries to run per mode")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", help="modes to run (default: all for the backend)")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed queries per mode")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel callers per mode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-db", action="store_true", help="benchmark in-process engines only")
+    parser.add_argument("--skip-seed", action="store_true", help="use the rows already in Postgres")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows afterwards")
+    parser.add_argument("--dsn", help="scratch Postgres to benchmark instead of search-script.py's DB_CONFIG "
+                                      "(implies --setup)")
+    parser.add_argument("--setup", action="store_true",
+                        help="run the search-script.py migrations on the benchmarked database first")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="encoder for --no-db")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+    args.setup = args.setup or bool(args.dsn)
+
+    available = MEMORY_MODES if args.no_db else DB_MODES + EXTRA_DB_MODES
+    unknown = [m for m in args.modes or () if m not in available]
+    if unknown:
+        parser.error(f"unknown mode(s) for the {'--no-db' if args.no_db else 'Postgres'} backend: "
+                     f"{', '.join(unknown)} (choose from {', '.join(available)})")
+    args.modes = args.modes or list(MEMORY_MODES if args.no_db else DB_MODES)
+    corpus = generate_corpus(args.messages, seed=args.seed)
+    queries = generate_queries(args.queries, seed=args.seed + 1)
+
+    report = (bench_memory if args.no_db else bench_postgres)(args, corpus, queries)
+    print_report(report, args.k)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"messages": args.messages, "queries": args.queries, "k": args.k, "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import json
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from topk import top_k
+
+
+# -----------------------------
+# BM25F inverted index over te_ai_message (+ linked te_ai_canonical_data)
+# -----------------------------
+# A document is one message; its fields are the message body and the text of
+# the canonical rows derived from it (cantxt_source_id = msg_id). With the
+# default field weights this is plain BM25 on the message body with the
+# canonical text as a lower-weighted second field.
+#
+# Posting lists are stored per term as blocks of BLOCK_SIZE postings:
+#   - doc ids as d-gaps in a uint8 stream; gaps >= 255 are patched from an
+#     exception table (PFor-style), so dense lists cost ~1 byte per doc id
+#   - one uint16 term frequency per field
+#   - per block: first/last doc id and the max BM25F score inside the block
+# Queries use MaxScore: terms with a high upper bound are scored in full,
+# the remaining terms only for surviving candidates, decoding only the blocks
+# whose doc range and block-max can still change the top-k.
+
+BLOCK_SIZE = 128
+EXCEPTION = 255
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+FIELDS = ("body", "canonical")
+
+CORPUS_QUERY = """
+    SELECT m.msg_id, m.msg_content_text, string_agg(c.cantxt_content_text, ' ')
+    FROM te_ai_message m
+    LEFT JOIN te_ai_canonical_data c ON c.cantxt_source_id = m.msg_id
+    GROUP BY m.msg_id, m.msg_content_text
+    ORDER BY m.msg_id
+"""
+
+ARRAYS = (
+    "ids", "doc_len", "idf", "upper_bound", "post_off", "gaps", "tf",
+    "exc_pos", "exc_val", "block_off", "block_pos", "block_first", "block_last", "block_max",
+)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+class BM25Index:
+    def __init__(self, path, k1=1.2, b=(0.75, 0.75), weights=(1.0, 0.5)):
+        self.path = path
+        self.k1 = k1
+        self.b = np.asarray(b, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.vocab = {}
+        self.avg_len = np.ones(len(FIELDS), dtype=np.float32)
+        for name in ARRAYS:
+            setattr(self, name, None)
+
+    def __len__(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # -----------------------------
+    # Load / save
+    # -----------------------------
+    def load(self):
+        if not os.path.exists(self._file("meta.json")):
+            return False
+        with open(self._file("meta.json")) as f:
+            meta = json.load(f)
+        self.k1 = meta["k1"]
+        self.b = np.asarray(meta["b"], dtype=np.float32)
+        self.weights = np.asarray(meta["weights"], dtype=np.float32)
+        self.avg_len = np.asarray(meta["avg_len"], dtype=np.float32)
+        self.vocab = meta["vocab"]
+        for name in ARRAYS:
+            setattr(self, name, np.load(self._file(name + ".npy"), mmap_mode="r"))
+        return True
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        for name in ARRAYS:
+            with open(self._file(name + ".npy.tmp"), "wb") as f:
+                np.save(f, getattr(self, name), allow_pickle=False)
+            os.replace(self._file(name + ".npy.tmp"), self._file(name + ".npy"))
+        meta = {
+            "k1": self.k1,
+            "b": self.b.tolist(),
+            "weights": self.weights.tolist(),
+            "avg_len": self.avg_len.tolist(),
+            "vocab": self.vocab,
+        }
+        # meta.json goes last: load() treats it as the "index complete" marker
+        with open(self._file("meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+
+    # -----------------------------
+    # Build
+    # -----------------------------
+    def build(self, conn):
+        cur = conn.cursor()
+        cur.execute(CORPUS_QUERY)
+        rows = cur.fetchall()
+        cur.close()
+        self.build_from_rows(rows)
+        self.save()
+        return len(rows)
+
+    def build_from_rows(self, rows):
+        # rows: (msg_id, body_text, canonical_text)
+        vocab = {}
+        terms, docs, fields, counts = array("q"), array("q"), array("q"), array("q")
+        doc_len = np.zeros((len(rows), len(FIELDS)), dtype=np.float32)
+        ids = []
+        for doc, row in enumerate(rows):
+            ids.append(row[0])
+            for field, text in enumerate(row[1:1 + len(FIELDS)]):
+                tokens = tokenize(text)
+                doc_len[doc, field] = len(tokens)
+                for term, count in Counter(tokens).items():
+                    terms.append(vocab.setdefault(term, len(vocab)))
+                    docs.append(doc)
+                    fields.append(field)
+                    counts.append(count)
+
+        terms, docs = np.frombuffer(terms, dtype=np.int64), np.frombuffer(docs, dtype=np.int64)
+        fields, counts = np.frombuffer(fields, dtype=np.int64), np.frombuffer(counts, dtype=np.int64)
+        n_docs, n_terms = len(rows), len(vocab)
+
+        self.vocab = vocab
+        self.ids = np.asarray(ids)
+        self.doc_len = doc_len
+        self.avg_len = np.maximum(doc_len.mean(axis=0), 1.0) if n_docs else np.ones(len(FIELDS), np.float32)
+
+        # One posting per (term, doc); the per-field counts become tf columns
+        order = np.lexsort((docs, terms))
+        terms, docs, fields, counts = terms[order], docs[order], fields[order], counts[order]
+        new_pair = np.ones(len(terms), dtype=bool)
+        new_pair[1:] = (terms[1:] != terms[:-1]) | (docs[1:] != docs[:-1])
+        pair = np.cumsum(new_pair) - 1
+        n_postings = int(pair[-1]) + 1 if len(pair) else 0
+        tf = np.zeros((n_postings, len(FIELDS)), dtype=np.uint16)
+        tf[pair, fields] = np.minimum(counts, np.iinfo(np.uint16).max)
+        p_term, p_doc = terms[new_pair], docs[new_pair]
+
+        df = np.bincount(p_term, minlength=n_terms)
+        post_off = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=post_off[1:])
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.post_off = post_off
+        self.tf = tf
+
+        # Cut every posting list into blocks of BLOCK_SIZE
+        pos_in_term = np.arange(n_postings) - post_off[p_term]
+        block_start = pos_in_term % BLOCK_SIZE == 0
+        block_pos = np.append(np.flatnonzero(block_start), n_postings).astype(np.int64)
+        blocks_per_term = np.bincount(p_term[block_start], minlength=n_terms)
+        block_off = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(blocks_per_term, out=block_off[1:])
+
+        gaps = np.zeros(n_postings, dtype=np.int64)
+        gaps[1:] = p_doc[1:] - p_doc[:-1]
+        gaps[block_start] = 0
+        exc = np.flatnonzero(gaps >= EXCEPTION)
+        self.exc_pos = exc.astype(np.int64)
+        self.exc_val = gaps[exc].astype(np.uint32)
+        self.gaps = np.minimum(gaps, EXCEPTION).astype(np.uint8)
+
+        self.block_off = block_off
+        self.block_pos = block_pos
+        self.block_first = p_doc[block_pos[:-1]].astype(np.uint32)
+        self.block_last = p_doc[block_pos[1:] - 1].astype(np.uint32)
+
+        scores = self._score(p_term, np.arange(n_postings), p_doc)
+        if n_postings:
+            self.block_max = np.maximum.reduceat(scores, block_pos[:-1]).astype(np.float32)
+            self.upper_bound = np.maximum.reduceat(self.block_max, block_off[:-1]).astype(np.float32)
+        else:
+            self.block_max = np.zeros(0, dtype=np.float32)
+            self.upper_bound = np.zeros(0, dtype=np.float32)
+
+    # -----------------------------
+    # Decoding / scoring
+    # -----------------------------
+    def _score(self, term, positions, docs):
+        # BM25F: field-weighted, length-normalized tf, saturated once
+        tf = np.asarray(self.tf[positions], dtype=np.float32)
+        norm = 1.0 - self.b + self.b * (np.asarray(self.doc_len[docs]) / self.avg_len)
+        pseudo = (tf * self.weights / norm).sum(axis=1)
+        return self.idf[term] * pseudo * (self.k1 + 1.0) / (self.k1 + pseudo)
+
+    def _decode(self, blocks):
+        # Returns (posting positions, doc ids) for the given sorted block ids
+        starts, ends = self.block_pos[blocks], self.block_pos[blocks + 1]
+        lens = ends - starts
+        total = int(lens.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        seg = np.repeat(np.arange(len(blocks)), lens)
+        seg_start = np.zeros(len(blocks), dtype=np.int64)
+        np.cumsum(lens[:-1], out=seg_start[1:])
+        positions = np.arange(total) + (starts - seg_start)[seg]
+
+        gaps = self.gaps[positions].astype(np.int64)
+        patched = np.flatnonzero(gaps == EXCEPTION)
+        if len(patched):
+            gaps[patched] = self.exc_val[np.searchsorted(self.exc_pos, positions[patched])]
+        run = np.cumsum(gaps)
+        docs = self.block_first[blocks].astype(np.int64)[seg] + run - run[seg_start][seg]
+        return positions, docs
+
+    def _term_blocks(self, term):
+        return np.arange(self.block_off[term], self.block_off[term + 1])
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def search(self, query_text, k=5):
+        terms = {self.vocab[t] for t in tokenize(query_text) if t in self.vocab}
+        if not terms or not len(self):
+            return []
+        terms = sorted(terms, key=lambda t: -self.upper_bound[t])
+        bounds = np.asarray([self.upper_bound[t] for t in terms], dtype=np.float32)
+        # rest[j]: best score an unseen doc can still collect from terms[j:]
+        rest = np.append(np.cumsum(bounds[::-1])[::-1], 0.0)
+
+        cand = np.zeros(0, dtype=np.int64)
+        cand_scores = np.zeros(0, dtype=np.float32)
+        theta = 0.0
+        j = 0
+
+        # Essential terms: full posting lists, any doc may still enter top-k
+        while j < len(terms) and (len(cand) < k or rest[j] > theta):
+            positions, docs = self._decode(self._term_blocks(terms[j]))
+            contrib = self._score(terms[j], positions, docs)
+            cand, cand_scores = _merge_scores(cand, cand_scores, docs, contrib)
+            theta = _kth(cand_scores, k)
+            j += 1
+
+        # Non-essential terms: only score candidates that can still beat theta
+        while j < len(terms):
+            alive = cand_scores + rest[j] > theta
+            if not alive.any():
+                break
+            alive_docs = cand[alive]
+            blocks = self._term_blocks(terms[j])
+            lo = np.searchsorted(alive_docs, self.block_first[blocks], side="left")
+            hi = np.searchsorted(alive_docs, self.block_last[blocks], side="right")
+            hit = hi > lo
+            if hit.any():
+                # Block-max: skip blocks that cannot lift any candidate over theta.
+                # reduceat over [lo_i, lo_next) is a safe overestimate of [lo_i, hi_i).
+                best_alive = np.maximum.reduceat(cand_scores[alive], lo[hit])
+                useful = best_alive + self.block_max[blocks[hit]] + rest[j + 1] > theta
+                positions, docs = self._decode(blocks[hit][useful])
+                in_cand = np.searchsorted(cand, docs)
+                in_cand = np.minimum(in_cand, len(cand) - 1)
+                keep = cand[in_cand] == docs
+                if keep.any():
+                    cand_scores[in_cand[keep]] += self._score(terms[j], positions[keep], docs[keep])
+                    theta = _kth(cand_scores, k)
+            j += 1
+
+        idx, values = top_k(cand_scores, k)
+        return [(self.ids[cand[i]].item(), float(v)) for i, v in zip(idx, values)]
+
+
+def _merge_scores(cand, cand_scores, docs, contrib):
+    # Both doc arrays are sorted and unique; returns the sorted union with summed scores
+    all_docs = np.concatenate([cand, docs])
+    all_scores = np.concatenate([cand_scores, contrib.astype(np.float32)])
+    merged, inverse = np.unique(all_docs, return_inverse=True)
+    return merged, np.bincount(inverse, weights=all_scores, minlength=len(merged)).astype(np.float32)
+
+
+def _kth(scores, k):
+    if len(scores) < k:
+        return 0.0
+    return float(np.partition(scores, len(scores) - k)[len(scores) - k])
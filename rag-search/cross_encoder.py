@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+
+from query_cache import LRUCache, normalize_query
+
+
+# -----------------------------
+# Cross-encoder reranking over first-stage candidates
+# -----------------------------
+# Only the first `top_n` hits of any search mode are rescored, in batches of
+# `batch_size`. Scores are cached per (model, query, doc id). The clock is
+# checked before every batch: once `time_budget` seconds are spent the
+# first-stage order is returned unchanged, so a slow CPU never turns into
+# unbounded latency (at most one batch over budget).
+#
+# Hits may be any of the shapes the search modes return:
+#   (id, text, score), (text, score), (id, text) or text
+
+
+def _id_text(hit):
+    if isinstance(hit, str):
+        return hit, hit
+    if len(hit) >= 3:
+        return hit[0], hit[1]
+    if isinstance(hit[0], str):
+        return hit[0], hit[0]
+    return hit[0], hit[1]
+
+
+def _with_score(hit, score):
+    if isinstance(hit, str):
+        return hit
+    if len(hit) >= 3:
+        return (hit[0], hit[1], score, *hit[3:])
+    if isinstance(hit[0], str):
+        return hit[0], score
+    return hit
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", top_n=50, batch_size=16,
+                 time_budget=0.25, cache_size=50000, device=None):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.device = device
+        self._model = None
+        self._scores = LRUCache(cache_size)
+        self.fallbacks = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            self._model = CrossEncoder(self.model_name, device=self.device)
+        return self._model
+
+    def warm_up(self):
+        self.model.predict([("warm up", "warm up")])
+        return self
+
+    def rerank(self, query_text, hits, k=None, time_budget=None):
+        budget = self.time_budget if time_budget is None else time_budget
+        started = time.perf_counter()
+        head, tail = list(hits[:self.top_n]), list(hits[self.top_n:])
+        if not head:
+            return list(hits)[:k]
+
+        query = normalize_query(query_text)
+        pairs = [_id_text(h) for h in head]
+        scores = np.empty(len(head), dtype=np.float32)
+        missing = []
+        for i, (doc_id, _) in enumerate(pairs):
+            cached = self._scores.get((self.model_name, query, doc_id))
+            if cached is None:
+                missing.append(i)
+            else:
+                scores[i] = cached
+
+        model = self.model
+        for start in range(0, len(missing), self.batch_size):
+            if budget is not None and time.perf_counter() - started > budget:
+                # Out of time: keep what was scored for next time, serve stage-1 order
+                self.fallbacks += 1
+                return (head + tail)[:k]
+            batch = missing[start:start + self.batch_size]
+            batch_scores = model.predict([(query_text, pairs[i][1]) for i in batch], batch_size=self.batch_size)
+            for i, score in zip(batch, np.asarray(batch_scores, dtype=np.float32).ravel()):
+                scores[i] = score
+                self._scores.put((self.model_name, query, pairs[i][0]), float(score))
+
+        order = np.argsort(-scores, kind="stable")
+        reranked = [_with_score(head[i], float(scores[i])) for i in order]
+        return (reranked + tail)[:k]
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+
+# -----------------------------
+# Shared connection pools for the search modes
+# -----------------------------
+# Both pools keep `minconn..maxconn` warm connections. A connection that has
+# been idle for longer than `health_check_interval` seconds is pinged with
+# `SELECT 1` before it is handed out; broken connections are discarded and
+# replaced, so callers never see a connection killed by a server restart or
+# an idle timeout.
+
+
+class ConnectionPool:
+    # psycopg2.pool.ThreadedConnectionPool closes every connection returned
+    # above `minconn`, so under concurrency it keeps reconnecting. This pool
+    # keeps up to `maxconn` idle connections and blocks (up to
+    # `acquire_timeout`) when all of them are checked out.
+
+    def __init__(self, db_config, minconn=1, maxconn=10, health_check_interval=30.0, acquire_timeout=10.0):
+        self.db_config = db_config
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._idle = deque()  # (conn, last_used)
+        for _ in range(minconn):
+            self._idle.append((psycopg2.connect(**db_config), time.monotonic()))
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise pool.PoolError("timed out waiting for a database connection")
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    return psycopg2.connect(**self.db_config)
+                conn, last_used = item
+                if self._healthy(conn, last_used):
+                    return conn
+                conn.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+        if not conn.closed:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop()[0].close()
+
+
+def asyncpg_placeholders(sql):
+    # Rewrites psycopg2 "%s" placeholders to asyncpg "$1, $2, ..." so both
+    # pools can share the same query builders
+    parts = sql.split("%s")
+    out = [parts[0]]
+    for i, part in enumerate(parts[1:], start=1):
+        out.append(f"${i}{part}")
+    return "".join(out)
+
+
+class AsyncConnectionPool:
+    # asyncpg-based pool for the async query path; asyncpg uses $1, $2, ...
+    # placeholders instead of psycopg2's %s
+
+    def __init__(self, db_config, minconn=1, maxconn=10, health_check_interval=30.0, acquire_timeout=10.0):
+        self.db_config = db_config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._pool = None
+        self._lock = asyncio.Lock()
+        self._last_used = {}
+
+    async def open(self):
+        import asyncpg
+
+        async with self._lock:
+            if self._pool is None:
+                config = dict(self.db_config)
+                config["database"] = config.pop("dbname", None)
+                self._pool = await asyncpg.create_pool(
+                    min_size=self.minconn,
+                    max_size=self.maxconn,
+                    max_inactive_connection_lifetime=300.0,
+                    **config,
+                )
+        return self
+
+    async def _healthy(self, conn):
+        if conn.is_closed():
+            return False
+        last_used = self._last_used.get(conn.get_server_pid(), 0.0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            await conn.fetchval("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._pool is None:
+            await self.open()
+        conn = await self._pool.acquire(timeout=self.acquire_timeout)
+        try:
+            if not await self._healthy(conn):
+                conn, broken = None, conn
+                await self._pool.release(broken)
+                await self._pool.expire_connections()
+                conn = await self._pool.acquire(timeout=self.acquire_timeout)
+            yield conn
+        finally:
+            if conn is not None:
+                self._last_used[conn.get_server_pid()] = time.monotonic()
+                await self._pool.release(conn)
+
+    async def fetch(self, query, *args):
+        async with self.connection() as conn:
+            return await conn.fetch(query, *args)
+
+    async def fetch_pg(self, sql, params=()):
+        # Same as fetch(), for queries written with psycopg2 placeholders
+        return await self.fetch(asyncpg_placeholders(sql), *params)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
@@ -0,0 +1,313 @@
+import json
+import os
+
+import numpy as np
+
+from quantization import QUANTIZATIONS, hamming_distances, pack_bits, quantize, scores
+from topk import top_k_rows
+
+
+# -----------------------------
+# Persistent embedding store for te_ai_canonical_data
+# -----------------------------
+# Layout of the store directory:
+#   meta.json        model name + embedding dim
+#   embeddings.npy   float32 [n, dim], L2-normalized rows (memory-mapped on load)
+#   ids.npy          cantxt_id per row
+#   hashes.npy       md5 of cantxt_content_text per row (computed by Postgres)
+#   langs.npy        cantxt_lang per row
+#   tenants.npy      cantxt_tntu_id per row
+#   codes_<q>.npy    quantized copy of embeddings.npy (+ scale_int8.npy), built
+#                    on first load for quantization="float16" / "int8" / "binary"
+#
+# The corpus is encoded once; `sync` only re-encodes rows whose content hash
+# changed and drops rows that no longer exist, so a query costs one encode of
+# the query string and one matrix-vector product. subset() copies the rows
+# of one tenant / language into a small in-memory store (see vector_shards.py).
+#
+# With a quantization other than float32 only the codes are held in RAM and
+# scored (see quantization.py); binary search takes the rescore_factor * k
+# closest codes by Hamming distance and rescores them with their float32 rows.
+
+SNAPSHOT_QUERY = """
+    SELECT cantxt_id, md5(cantxt_content_text), cantxt_lang, cantxt_tntu_id::text
+    FROM te_ai_canonical_data
+    ORDER BY cantxt_id
+"""
+
+CONTENT_QUERY = """
+    SELECT cantxt_id, cantxt_content_text
+    FROM te_ai_canonical_data
+    WHERE cantxt_id = ANY(%s)
+"""
+
+
+class EmbeddingStore:
+    def __init__(self, path, model_name, quantization="float32", rescore_factor=10):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"unknown quantization: {quantization}")
+        self.path = path
+        self.model_name = model_name
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.embeddings = None
+        self.codes = None
+        self.scale = None
+        # Shards of a quantized store: row of each shard row in self.embeddings
+        self._source_rows = None
+        self.ids = None
+        self.hashes = None
+        self.langs = None
+        self.tenants = None
+        self._row_of = None
+
+    def __len__(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # -----------------------------
+    # Load / save
+    # -----------------------------
+    def load(self):
+        meta_file = self._file("meta.json")
+        if not os.path.exists(meta_file):
+            return False
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta.get("model_name") != self.model_name:
+            # Vectors from another model are useless, force a full rebuild
+            return False
+        self.embeddings = np.load(self._file("embeddings.npy"), mmap_mode="r")
+        self.ids = np.load(self._file("ids.npy"))
+        self.hashes = np.load(self._file("hashes.npy"))
+        self.langs = np.load(self._file("langs.npy"))
+        # Stores written before tenants were tracked get them on the next sync
+        tenants_file = self._file("tenants.npy")
+        self.tenants = np.load(tenants_file) if os.path.exists(tenants_file) else None
+        self._row_of = None
+        self._load_codes()
+        return True
+
+    def _load_codes(self):
+        if self.quantization == "float32":
+            self.codes, self.scale = self.embeddings, None
+            return
+        codes_file = self._file(f"codes_{self.quantization}.npy")
+        scale_file = self._file(f"scale_{self.quantization}.npy")
+        if os.path.exists(codes_file):
+            self.codes = np.load(codes_file)
+            self.scale = np.load(scale_file) if os.path.exists(scale_file) else None
+            if len(self.codes) == len(self):
+                return
+        self.codes, self.scale = quantize(self.embeddings, self.quantization)
+        np.save(codes_file, self.codes, allow_pickle=False)
+        if self.scale is not None:
+            np.save(scale_file, self.scale, allow_pickle=False)
+
+    def _save(self, ids, hashes, langs, tenants, dim):
+        # embeddings.npy.tmp has already been written by sync(); swap every
+        # temp file in only now, so a crash mid-sync never leaves a
+        # half-written matrix behind.
+        arrays = {"ids.npy": ids, "hashes.npy": hashes, "langs.npy": langs, "tenants.npy": tenants}
+        # Quantized codes of the old matrix are rebuilt by load()
+        for method in QUANTIZATIONS:
+            for name in (f"codes_{method}.npy", f"scale_{method}.npy"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+        for name, arr in arrays.items():
+            with open(self._file(name + ".tmp"), "wb") as f:
+                np.save(f, arr, allow_pickle=False)
+        for name in ["embeddings.npy", *arrays]:
+            os.replace(self._file(name + ".tmp"), self._file(name))
+        meta = {"model_name": self.model_name, "dim": int(dim)}
+        with open(self._file("meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+
+    # -----------------------------
+    # Incremental sync with Postgres
+    # -----------------------------
+    def sync(self, conn, model, batch_size=256, chunk_size=10000):
+        cur = conn.cursor()
+        cur.execute(SNAPSHOT_QUERY)
+        snapshot = cur.fetchall()
+
+        ids = np.asarray([r[0] for r in snapshot])
+        hashes = np.asarray([r[1] or "" for r in snapshot], dtype="S32")
+        langs = np.asarray([r[2] or "" for r in snapshot])
+        tenants = np.asarray([r[3] or "" for r in snapshot])
+
+        # Map (id, hash) of what we already have to its row in the old matrix
+        known = {}
+        if self.ids is not None:
+            for row, (cid, h) in enumerate(zip(self.ids.tolist(), self.hashes.tolist())):
+                known[(cid, h)] = row
+
+        keep_new, keep_old, stale = [], [], []
+        for row, (cid, h) in enumerate(zip(ids.tolist(), hashes.tolist())):
+            old_row = known.get((cid, h))
+            if old_row is None:
+                stale.append(row)
+            else:
+                keep_new.append(row)
+                keep_old.append(old_row)
+
+        unchanged = not stale and len(keep_old) == len(self) and keep_old == list(range(len(self)))
+        if unchanged and self.embeddings is not None:
+            cur.close()
+            if not np.array_equal(langs, self.langs):
+                np.save(self._file("langs.npy"), langs, allow_pickle=False)
+                self.langs = langs
+            if self.tenants is None or not np.array_equal(tenants, self.tenants):
+                np.save(self._file("tenants.npy"), tenants, allow_pickle=False)
+                self.tenants = tenants
+            return 0
+
+        # The new matrix is written straight into a memory-mapped temp file and
+        # stale rows are fetched/encoded `chunk_size` at a time, so neither
+        # the matrix nor the corpus text has to fit in RAM
+        dim = model.get_sentence_embedding_dimension()
+        os.makedirs(self.path, exist_ok=True)
+        embeddings = np.lib.format.open_memmap(
+            self._file("embeddings.npy.tmp"), mode="w+", dtype=np.float32, shape=(len(ids), dim)
+        )
+        for start in range(0, len(keep_new), chunk_size):
+            rows = slice(start, start + chunk_size)
+            embeddings[keep_new[rows]] = self.embeddings[keep_old[rows]]
+
+        for start in range(0, len(stale), chunk_size):
+            rows = stale[start:start + chunk_size]
+            chunk_ids = ids[rows].tolist()
+            cur.execute(CONTENT_QUERY, (chunk_ids,))
+            texts = dict(cur.fetchall())
+            vectors = model.encode(
+                [texts.get(cid) or "" for cid in chunk_ids],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            embeddings[rows] = vectors.astype(np.float32, copy=False)
+        cur.close()
+        embeddings.flush()
+        del embeddings
+
+        self._save(ids, hashes, langs, tenants, dim)
+        self.load()
+        return len(stale)
+
+    @classmethod
+    def from_arrays(cls, embeddings, ids, model_name=None, langs=None, tenants=None, **kwargs):
+        # In-memory store over precomputed rows (not saved or synced), e.g. for benchmarks
+        store = cls(None, model_name, **kwargs)
+        store.embeddings = np.asarray(embeddings, dtype=np.float32)
+        store.ids = np.asarray(ids)
+        store.hashes = np.zeros(len(store.ids), dtype="S32")
+        store.langs = np.asarray(langs if langs is not None else [""] * len(store.ids))
+        store.tenants = None if tenants is None else np.asarray(tenants)
+        store.codes, store.scale = quantize(store.embeddings, store.quantization)
+        return store
+
+    # -----------------------------
+    # Partitions
+    # -----------------------------
+    def rows_for(self, tenant_id=None, lang=None):
+        mask = np.ones(len(self), dtype=bool)
+        if tenant_id is not None:
+            if self.tenants is None:
+                raise ValueError(f"embedding store {self.path} has no tenant column, sync it first")
+            mask &= self.tenants == str(tenant_id)
+        if lang is not None:
+            mask &= self.langs == lang
+        return np.flatnonzero(mask)
+
+    def subset(self, rows):
+        # In-memory store over the given rows only; not saved or synced.
+        # Quantized stores copy just the codes and keep reading float32 rows
+        # (for rescoring) from the parent's memmap.
+        shard = EmbeddingStore(None, self.model_name, self.quantization, self.rescore_factor)
+        if self.quantization == "float32":
+            shard.embeddings = np.ascontiguousarray(self.embeddings[rows], dtype=np.float32)
+            shard.codes = shard.embeddings
+        else:
+            shard.embeddings = self.embeddings
+            shard._source_rows = rows if self._source_rows is None else self._source_rows[rows]
+            shard.codes = np.ascontiguousarray(self.codes[rows])
+            shard.scale = self.scale
+        shard.ids = self.ids[rows]
+        shard.hashes = self.hashes[rows]
+        shard.langs = self.langs[rows]
+        shard.tenants = None if self.tenants is None else self.tenants[rows]
+        return shard
+
+    @property
+    def nbytes(self):
+        # Bytes scored per query (and held in RAM once touched)
+        return 0 if self.codes is None else self.codes.nbytes
+
+    def _float_rows(self, rows):
+        if self._source_rows is not None:
+            rows = self._source_rows[rows]
+        return np.asarray(self.embeddings[rows], dtype=np.float32)
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def vectors_for(self, ids):
+        # -> ([len(ids), dim] embeddings, found mask); rows for unknown ids are zero
+        if self._row_of is None:
+            self._row_of = {cid: row for row, cid in enumerate(self.ids.tolist())}
+        rows = np.array([self._row_of.get(cid, -1) for cid in ids], dtype=np.int64)
+        found = rows >= 0
+        vectors = np.zeros((len(ids), self.embeddings.shape[1]), dtype=np.float32)
+        vectors[found] = self._float_rows(rows[found])
+        return vectors, found
+
+    def search(self, query_emb, k=5, mask=None):
+        return self.search_many(np.asarray(query_emb, dtype=np.float32).reshape(1, -1), k=k, mask=mask)[0]
+
+    def search_many(self, query_embs, k=5, mask=None, max_block=1 << 26):
+        # One matrix-matrix product per block of queries; blocks are sized so
+        # the [queries, corpus] score matrix stays under max_block floats
+        query_embs = np.asarray(query_embs, dtype=np.float32)
+        if not len(self):
+            return [[] for _ in range(len(query_embs))]
+        norms = np.maximum(np.linalg.norm(query_embs, axis=1, keepdims=True), 1e-12)
+        query_embs = query_embs / norms
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+        if self.quantization == "binary":
+            return self._search_binary(query_embs, k, mask, max_block)
+        step = max(1, max_block // len(self))
+
+        results = []
+        for start in range(0, len(query_embs), step):
+            block = scores(query_embs[start:start + step], self.codes, self.quantization, self.scale)
+            if mask is not None:
+                block[:, ~mask] = -np.inf
+            for idx, values in top_k_rows(block, k):
+                results.append([(self.ids[i].item(), float(v)) for i, v in zip(idx, values)])
+        return results
+
+    def _search_binary(self, query_embs, k, mask, max_block):
+        # Hamming pre-filter over the sign codes, exact float32 rescoring of
+        # the rescore_factor * k closest rows
+        n_candidates = min(len(self), max(k * self.rescore_factor, k))
+        query_bits = pack_bits(query_embs)
+        step = max(1, max_block // (len(self) * self.codes.shape[1]))
+
+        results = []
+        for start in range(0, len(query_embs), step):
+            distances = hamming_distances(query_bits[start:start + step], self.codes)
+            if mask is not None:
+                distances[:, ~mask] = np.iinfo(np.int32).max
+            candidates = np.argpartition(distances, n_candidates - 1, axis=1)[:, :n_candidates]
+            for query_emb, rows in zip(query_embs[start:start + step], candidates):
+                rows = np.sort(rows)
+                exact = self._float_rows(rows) @ query_emb
+                if mask is not None:
+                    exact[~mask[rows]] = -np.inf
+                idx, values = top_k_rows(exact[None, :], k)[0]
+                results.append([(self.ids[rows[i]].item(), float(v)) for i, v in zip(idx, values)])
+        return results
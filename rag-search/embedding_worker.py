@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# -----------------------------
+# Micro-batching embedding worker
+# -----------------------------
+# Callers on any thread submit single query strings and get a Future back. A
+# background thread takes the first pending text, keeps collecting for up to
+# `max_wait` seconds or until `max_batch` texts, encodes them with one
+# `encode_many(texts)` call and resolves each caller's future with its row.
+#
+#   worker = EmbeddingWorker(encode_queries, max_batch=32, max_wait=0.005)
+#   emb = worker.encode("tooth pain")                  # blocking
+#   emb = await asyncio.wrap_future(worker.submit(q))  # from async code
+#
+# The thread starts on the first submit; close() drains and stops it.
+
+_STOP = object()
+
+
+class EmbeddingWorker:
+    def __init__(self, encode_many, max_batch=32, max_wait=0.005):
+        self.encode_many = encode_many
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.encoded = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-worker", daemon=True)
+                self._thread.start()
+
+    def submit(self, text):
+        future = Future()
+        self._start()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    def close(self, timeout=None):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, stop = [item], False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._encode(batch)
+            if stop:
+                return
+
+    def _encode(self, batch):
+        # Callers that cancelled while waiting are dropped from the batch
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            vectors = self.encode_many([text for text, _ in batch])
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.encoded += len(batch)
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
@@ -0,0 +1,83 @@
+import threading
+
+
+# -----------------------------
+# Lazily loaded sentence encoder
+# -----------------------------
+# Drop-in for the SentenceTransformer calls used by the search modes
+# (encode / get_sentence_embedding_dimension). Nothing is imported or loaded
+# until the first semantic call or an explicit warm_up(), so keyword-only
+# runs never pay the torch import and model load.
+#
+# Backends:
+#   "torch"  - regular SentenceTransformer
+#   "onnx"   - same model on ONNX Runtime (sentence-transformers >= 3.2);
+#              `onnx_file_name` picks the graph, e.g. one of the int8
+#              dynamically quantized files shipped with all-MiniLM-L6-v2
+#              ("onnx/model_qint8_avx512_vnni.onnx", "onnx/model_quint8_avx2.onnx")
+#
+# export_quantized_onnx() produces such an int8 file for models that do not
+# ship one.
+
+BACKENDS = ("torch", "onnx")
+
+
+class Encoder:
+    def __init__(self, model_name, backend="torch", onnx_file_name=None, device=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown encoder backend: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_file_name = onnx_file_name
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "onnx":
+            model_kwargs = {"file_name": self.onnx_file_name} if self.onnx_file_name else None
+            return SentenceTransformer(
+                self.model_name, backend="onnx", model_kwargs=model_kwargs, device=self.device
+            )
+        return SentenceTransformer(self.model_name, device=self.device)
+
+    def warm_up(self):
+        # Loads the model and runs one batch so the first real query does not
+        # pay for lazy kernel / session initialisation
+        self.model.encode(["warm up"], convert_to_numpy=True, normalize_embeddings=True)
+        return self
+
+    def encode(self, sentences, **kwargs):
+        return self.model.encode(sentences, **kwargs)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+
+def export_quantized_onnx(model_name, output_dir, config="avx512_vnni"):
+    # Writes <output_dir>/onnx/model_<weights dtype>_<config>.onnx (qint8 for
+    # the avx512 / arm64 configs, quint8 for avx2) and returns that relative
+    # path; load it with Encoder(output_dir, backend="onnx", onnx_file_name=...)
+    from optimum.onnxruntime import AutoQuantizationConfig
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    weights_dtype = getattr(AutoQuantizationConfig, config)(is_static=False).weights_dtype.name.lower()
+    file_suffix = f"{weights_dtype}_{config}"
+    model = SentenceTransformer(model_name, backend="onnx")
+    model.save(output_dir)
+    export_dynamic_quantized_onnx_model(model, config, output_dir, file_suffix=file_suffix)
+    return f"onnx/model_{file_suffix}.onnx"
@@ -0,0 +1,118 @@
+# -----------------------------
+# Index-backed keyword search for te_ai_message / te_ai_canonical_data
+# -----------------------------
+# Primary path: STORED generated tsvector column + GIN index, queried with
+# websearch_to_tsquery and ranked with ts_rank_cd.
+# Fallback: pg_trgm GIN index on the raw text, which lets ILIKE '%kw%' use an
+# index for substrings / partial words the full-text parser does not match.
+#
+# create_fulltext_indexes() is the migration helper that adds the columns,
+# the extension and all four indexes.
+
+TS_CONFIG = "english"
+
+TABLES = {
+    # table: (text column, tsvector column)
+    "te_ai_message": ("msg_content_text", "msg_content_tsv"),
+    "te_ai_canonical_data": ("cantxt_content_text", "cantxt_content_tsv"),
+}
+
+
+def create_fulltext_indexes(conn, concurrently=True):
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for table, (text_col, tsv_col) in TABLES.items():
+                cur.execute(f"""
+                    ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {tsv_col} tsvector
+                    GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', coalesce({text_col}, ''))) STORED
+                """)
+                how = "CONCURRENTLY" if concurrently else ""
+                cur.execute(f"CREATE INDEX {how} IF NOT EXISTS {table}_{tsv_col}_gin_idx "
+                            f"ON {table} USING gin ({tsv_col})")
+                cur.execute(f"CREATE INDEX {how} IF NOT EXISTS {table}_{text_col}_trgm_idx "
+                            f"ON {table} USING gin ({text_col} gin_trgm_ops)")
+    finally:
+        conn.autocommit = autocommit
+
+
+def like_pattern(keyword):
+    escaped = keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _limit_sql(limit):
+    return "" if limit is None else f"LIMIT {int(limit)}"
+
+
+# -----------------------------
+# Query builders: return (sql, params) in psycopg2 %s style
+# -----------------------------
+def message_fulltext_query(keyword, limit=None):
+    return f"""
+        SELECT msg_id, msg_content_text
+        FROM te_ai_message, websearch_to_tsquery('{TS_CONFIG}', %s) AS q
+        WHERE msg_content_tsv @@ q
+        ORDER BY ts_rank_cd(msg_content_tsv, q) DESC
+        {_limit_sql(limit)}
+    """, (keyword,)
+
+
+def message_substring_query(keyword, limit=None):
+    return f"""
+        SELECT msg_id, msg_content_text
+        FROM te_ai_message
+        WHERE msg_content_text ILIKE %s
+        {_limit_sql(limit)}
+    """, (like_pattern(keyword),)
+
+
+def canonical_fulltext_query(keyword, lang, limit=None):
+    return f"""
+        SELECT cantxt_content_text
+        FROM te_ai_canonical_data, websearch_to_tsquery('{TS_CONFIG}', %s) AS q
+        WHERE cantxt_content_tsv @@ q AND cantxt_lang = %s
+        ORDER BY ts_rank_cd(cantxt_content_tsv, q) DESC
+        {_limit_sql(limit)}
+    """, (keyword, lang)
+
+
+def canonical_substring_query(keyword, lang, limit=None):
+    return f"""
+        SELECT cantxt_content_text
+        FROM te_ai_canonical_data
+        WHERE cantxt_content_text ILIKE %s AND cantxt_lang = %s
+        {_limit_sql(limit)}
+    """, (like_pattern(keyword), lang)
+
+
+# -----------------------------
+# Search: full-text first, trigram substring match if that finds nothing
+# -----------------------------
+def _first_hit(conn, queries):
+    rows = []
+    with conn.cursor() as cur:
+        for sql, params in queries:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            if rows:
+                break
+    conn.rollback()
+    return rows
+
+
+def search_messages(conn, keyword, limit=None):
+    return _first_hit(conn, [
+        message_fulltext_query(keyword, limit),
+        message_substring_query(keyword, limit),
+    ])
+
+
+def search_canonical(conn, keyword, lang, limit=None):
+    rows = _first_hit(conn, [
+        canonical_fulltext_query(keyword, lang, limit),
+        canonical_substring_query(keyword, lang, limit),
+    ])
+    return [r[0] for r in rows]
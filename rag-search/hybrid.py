@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import pgvector_index
+from fulltext_index import TS_CONFIG
+from topk import top_k
+
+
+# -----------------------------
+# Hybrid retrieval: keyword + pgvector ANN, fused
+# -----------------------------
+# Both candidate queries run concurrently on separate pooled connections and
+# carry the same pushed-down filters (cantxt_lang, cantxt_tntu_id), so only
+# `candidates` rows per side leave Postgres. The two ranked lists are fused
+# with reciprocal-rank fusion (default) or min-max normalized weighted scores.
+
+RRF_K = 60
+
+# Filtered vector candidates on pgvector < 0.8 (no iterative index scan):
+# rows fetched per candidate wanted, before the filter thins them out
+FILTERED_OVERFETCH = 10
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid")
+
+
+def build_filters(lang=None, tenant_id=None):
+    clauses, params = [], []
+    if lang is not None:
+        clauses.append("cantxt_lang = %s")
+        params.append(lang)
+    if tenant_id is not None:
+        clauses.append("cantxt_tntu_id = %s")
+        params.append(tenant_id)
+    return " AND ".join(clauses), tuple(params)
+
+
+def keyword_candidates(conn, query_text, n, where="", params=()):
+    # Uses the generated tsvector column + GIN index from fulltext_index.py
+    extra = f"AND {where}" if where else ""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT cantxt_id, cantxt_content_text, ts_rank_cd(cantxt_content_tsv, q) AS rank
+            FROM te_ai_canonical_data, websearch_to_tsquery('{TS_CONFIG}', %s) AS q
+            WHERE cantxt_content_tsv @@ q {extra}
+            ORDER BY rank DESC
+            LIMIT %s
+        """, (query_text, *params, int(n)))
+        rows = cur.fetchall()
+    conn.rollback()
+    return [(r[0], r[1], float(r[2])) for r in rows]
+
+
+def vector_candidates(conn, query_embedding, n, where="", params=(), metric="cosine", **knobs):
+    limit = n
+    if where:
+        # pgvector filters after the index scan: a selective tenant / lang
+        # filter leaves only a few of the ef_search rows. pgvector >= 0.8 keeps
+        # scanning (relaxed_order, re-sorted below); older versions get
+        # FILTERED_OVERFETCH times the rows instead. Either way the planner
+        # may pick a plain scan when the filter is selective enough.
+        if pgvector_index.supports_iterative_scan(conn):
+            knobs.setdefault("iterative_scan", "relaxed_order")
+        else:
+            limit = n * FILTERED_OVERFETCH
+        knobs.setdefault("force_index", False)
+    rows = pgvector_index.ann_search(
+        conn, query_embedding, k=limit, metric=metric, where=where or None, params=params, **knobs
+    )
+    if where:
+        rows = sorted(rows, key=lambda r: r[-1])[:n]
+    # Turn distances into "higher is better" scores for weighted fusion
+    return [(r[0], r[1], -float(r[2])) for r in rows]
+
+
+# -----------------------------
+# Fusion
+# -----------------------------
+def reciprocal_rank_fusion(ranked_lists, weights=None, k=RRF_K):
+    weights = weights or [1.0] * len(ranked_lists)
+    fused = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, doc_id in enumerate(ranked):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank + 1)
+    return fused
+
+
+def weighted_score_fusion(scored_lists, weights=None):
+    # scored_lists: [{doc_id: score}], each min-max normalized to [0, 1] first
+    weights = weights or [1.0] * len(scored_lists)
+    fused = {}
+    for scores, weight in zip(scored_lists, weights):
+        if not scores:
+            continue
+        lo, hi = min(scores.values()), max(scores.values())
+        span = (hi - lo) or 1.0
+        for doc_id, score in scores.items():
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * (score - lo) / span
+    return fused
+
+
+def hybrid_retrieve(pool, query_text, query_embedding, k=5, candidates=50, lang=None, tenant_id=None,
+                    fusion="rrf", weights=(1.0, 1.0), metric="cosine", executor=None, **knobs):
+    where, params = build_filters(lang, tenant_id)
+    executor = executor or _executor
+
+    def run(fn, *args, **kwargs):
+        with pool.connection() as conn:
+            return fn(conn, *args, **kwargs)
+
+    keyword_future = executor.submit(run, keyword_candidates, query_text, candidates, where, params)
+    vector_future = executor.submit(
+        run, vector_candidates, query_embedding, candidates, where, params, metric=metric, **knobs
+    )
+    keyword_hits, vector_hits = keyword_future.result(), vector_future.result()
+
+    content = {doc_id: text for doc_id, text, _ in keyword_hits + vector_hits}
+    if fusion == "rrf":
+        fused = reciprocal_rank_fusion(
+            [[h[0] for h in keyword_hits], [h[0] for h in vector_hits]], weights=list(weights)
+        )
+    elif fusion == "weighted":
+        fused = weighted_score_fusion(
+            [{h[0]: h[2] for h in keyword_hits}, {h[0]: h[2] for h in vector_hits}], weights=list(weights)
+        )
+    else:
+        raise ValueError(f"unknown fusion method: {fusion}")
+
+    doc_ids = list(fused)
+    idx, values = top_k(np.fromiter(fused.values(), dtype=np.float64, count=len(fused)), k)
+    return [(doc_ids[i], content[doc_ids[i]], float(v)) for i, v in zip(idx, values)]
@@ -0,0 +1,532 @@
+import csv
+import hashlib
+import io
+import itertools
+import json
+import uuid
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+
+# -----------------------------
+# Bulk conversation ingestion
+# -----------------------------
+# Conversations are dicts (one per JSONL line, or grouped CSV rows):
+#
+#   {"id": "c-1", "tenant": "Dental Clinic", "user_id": 101,
+#    "project": "AI Dental Assistant", "lang": "en", "created": "2025-01-31T10:00:00",
+#    "messages": [{"role": "user", "text": "...", "status": "completed",
+#                  "lang": "en", "memory": true}, ...]}
+#
+# CSV: one message per row with columns conversation_id, tenant, user_id,
+# project, role, text and optionally lang, status, memory; rows of one
+# conversation must be consecutive.
+#
+# Tenants are resolved by name, tenant users by (tenant, user_id) and projects
+# by (tenant user, title) through a LookupCache kept for the whole run, and
+# are only created when missing, so the owner layout does not depend on the
+# batch size. Per batch, chats are created once per conversation with
+# execute_values. All messages of the batch are COPYed into a temp staging
+# table, get msg_ids from the table's sequence in one UPDATE, and
+# te_ai_message, te_ai_canonical_data and te_ai_memory are filled from the
+# stage with one INSERT ... SELECT each. The new canonical rows are handed to
+# the optional `embed` stage (see ingest_embeddings.py) in the same
+# transaction. Roles and statuses go through the same LookupCache.
+#
+# Without upsert every conversation becomes a new chat with new messages.
+# upsert=True makes a run idempotent: chats / messages / canonical / memory
+# rows carry a content hash (the conversation "id" if given, else its
+# content; plus the message position, role and text) behind a partial unique
+# index, so a replayed dump only inserts what is new (ON CONFLICT DO NOTHING)
+# and updates the status of messages it already has. ensure_upsert_schema()
+# adds the hash columns and indexes; it is a migration (`insert-data.py
+# --setup`), ingest runs only check that it was applied.
+
+ROLE_NAMES = {"user": "Patient", "assistant": "Dentist"}
+MEMORY_ROLES = ("user",)
+
+STAGE_COLUMNS = (
+    "ord", "cht_id", "pro_id", "tntu_id", "role_id", "status_id", "content", "lang", "n_tokens", "memory",
+    "content_hash",
+)
+
+STAGE_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS ingest_message_stage (
+        ord bigint,
+        msg_id bigint,
+        cht_id bigint,
+        pro_id bigint,
+        tntu_id uuid,
+        role_id bigint,
+        status_id bigint,
+        content text,
+        lang text,
+        n_tokens integer,
+        memory boolean,
+        content_hash text,
+        is_new boolean NOT NULL DEFAULT true
+    )
+"""
+
+LINK_SQL = (
+    """
+    UPDATE ingest_message_stage
+    SET msg_id = nextval(pg_get_serial_sequence('te_ai_message', 'msg_id'))
+    """,
+    """
+    INSERT INTO te_ai_message (msg_id, msg_cht_id, msg_msgrole_id, msg_content_text, msg_msgsts_id)
+    SELECT msg_id, cht_id, role_id, content, status_id
+    FROM ingest_message_stage
+    ORDER BY ord
+    """,
+)
+
+CANONICAL_SQL = """
+    INSERT INTO te_ai_canonical_data (
+        cantxt_tntu_id, cantxt_type, cantxt_source_id,
+        cantxt_content_text, cantxt_lang, cantxt_n_tokens, cantxt_pii_level, cantxt_srctyp_id
+    )
+    SELECT tntu_id, 'text', msg_id, content, lang, n_tokens, 'low', 1
+    FROM ingest_message_stage
+    ORDER BY ord
+    RETURNING cantxt_id, cantxt_content_text
+"""
+
+MEMORY_SQL = """
+    INSERT INTO te_ai_memory (mem_tntu_id, mem_pro_id, mem_cht_id, mem_text, mem_type, mem_confidence, mem_source_type)
+    SELECT tntu_id, pro_id, cht_id, content, 'patient_note', 0.9, 'message'
+    FROM ingest_message_stage
+    WHERE memory
+    ORDER BY ord
+"""
+
+# -----------------------------
+# Idempotent (upsert) mode
+# -----------------------------
+HASH_COLUMNS = {
+    "te_ai_chat": "cht_content_hash",
+    "te_ai_message": "msg_content_hash",
+    "te_ai_canonical_data": "cantxt_content_hash",
+    "te_ai_memory": "mem_content_hash",
+}
+
+# Messages ingested by an earlier run keep their id; only new ones get one
+UPSERT_MATCH_SQL = (
+    """
+    UPDATE ingest_message_stage s
+    SET msg_id = m.msg_id, is_new = false
+    FROM te_ai_message m
+    WHERE m.msg_content_hash = s.content_hash
+    """,
+    """
+    UPDATE ingest_message_stage
+    SET msg_id = nextval(pg_get_serial_sequence('te_ai_message', 'msg_id'))
+    WHERE is_new
+    """,
+)
+
+UPSERT_MESSAGE_SQL = """
+    INSERT INTO te_ai_message (msg_id, msg_cht_id, msg_msgrole_id, msg_content_text, msg_msgsts_id, msg_content_hash)
+    SELECT msg_id, cht_id, role_id, content, status_id, content_hash
+    FROM ingest_message_stage
+    WHERE is_new
+    ORDER BY ord
+    ON CONFLICT (msg_content_hash) WHERE msg_content_hash IS NOT NULL DO NOTHING
+"""
+
+UPSERT_STATUS_SQL = """
+    UPDATE te_ai_message m
+    SET msg_msgsts_id = s.status_id
+    FROM ingest_message_stage s
+    WHERE m.msg_id = s.msg_id AND NOT s.is_new AND m.msg_msgsts_id IS DISTINCT FROM s.status_id
+"""
+
+UPSERT_CANONICAL_SQL = """
+    INSERT INTO te_ai_canonical_data (
+        cantxt_tntu_id, cantxt_type, cantxt_source_id,
+        cantxt_content_text, cantxt_lang, cantxt_n_tokens, cantxt_pii_level, cantxt_srctyp_id,
+        cantxt_content_hash
+    )
+    SELECT tntu_id, 'text', msg_id, content, lang, n_tokens, 'low', 1, content_hash
+    FROM ingest_message_stage
+    WHERE is_new
+    ORDER BY ord
+    ON CONFLICT (cantxt_content_hash) WHERE cantxt_content_hash IS NOT NULL DO NOTHING
+    RETURNING cantxt_id, cantxt_content_text
+"""
+
+UPSERT_MEMORY_SQL = """
+    INSERT INTO te_ai_memory (
+        mem_tntu_id, mem_pro_id, mem_cht_id, mem_text, mem_type, mem_confidence, mem_source_type, mem_content_hash
+    )
+    SELECT tntu_id, pro_id, cht_id, content, 'patient_note', 0.9, 'message', content_hash
+    FROM ingest_message_stage
+    WHERE memory AND is_new
+    ORDER BY ord
+    ON CONFLICT (mem_content_hash) WHERE mem_content_hash IS NOT NULL DO NOTHING
+"""
+
+
+def hash_index_name(table, column):
+    return f"{table}_{column}_key"
+
+
+def ensure_upsert_schema(conn):
+    # Nullable hash columns + partial unique indexes: rows written without a
+    # hash (older data, non-upsert runs) never conflict. Columns are only
+    # ALTERed in when missing (the ALTER locks the table even as a no-op);
+    # indexes are built CONCURRENTLY so searches keep running, and an index
+    # left invalid by an interrupted build is dropped and rebuilt.
+    for table, column in HASH_COLUMNS.items():
+        if not column_exists(conn, table, column):
+            with conn.cursor() as cur:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} text")
+            conn.commit()
+
+    invalid = {name for name, valid in _hash_indexes(conn).items() if not valid}
+    autocommit = conn.autocommit
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for table, column in HASH_COLUMNS.items():
+                name = hash_index_name(table, column)
+                if name in invalid:
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cur.execute(f"""
+                    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name}
+                    ON {table} ({column}) WHERE {column} IS NOT NULL
+                """)
+    finally:
+        conn.autocommit = autocommit
+
+
+def check_upsert_schema(conn):
+    indexes = _hash_indexes(conn)
+    missing = [name for name in (hash_index_name(t, c) for t, c in HASH_COLUMNS.items()) if not indexes.get(name)]
+    if missing:
+        raise RuntimeError(f"upsert indexes missing or invalid ({', '.join(missing)}): "
+                           "run `python insert-data.py --setup` (ensure_upsert_schema()) first")
+
+
+def _hash_indexes(conn):
+    # index name -> valid, for the hash indexes that exist
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname, ix.indisvalid
+            FROM pg_index ix
+            JOIN pg_class c ON c.oid = ix.indexrelid
+            WHERE c.relname = ANY(%s)
+        """, ([hash_index_name(t, c) for t, c in HASH_COLUMNS.items()],))
+        found = dict(cur.fetchall())
+    conn.rollback()
+    return found
+
+
+def conversation_hash(conversation):
+    identity = conversation.get("id")
+    if identity is None:
+        identity = [(m["role"], m["text"]) for m in conversation["messages"]]
+    return _md5(["chat", *_owner_key(conversation), identity])
+
+
+def message_hash(chat_hash, position, message):
+    return _md5([chat_hash, position, message["role"], message["text"]])
+
+
+def _md5(parts):
+    return hashlib.md5(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+# -----------------------------
+# Readers
+# -----------------------------
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        for conversation_id, rows in itertools.groupby(csv.DictReader(f), key=lambda r: r["conversation_id"]):
+            rows = list(rows)
+            first = rows[0]
+            yield {
+                "id": conversation_id,
+                "tenant": first["tenant"],
+                "user_id": int(first["user_id"]),
+                "project": first["project"],
+                "lang": first.get("lang") or "en",
+                "messages": [
+                    {
+                        "role": r["role"],
+                        "text": r["text"],
+                        "lang": r.get("lang") or None,
+                        "status": r.get("status") or None,
+                        "memory": _parse_bool(r["memory"]) if r.get("memory") else None,
+                    }
+                    for r in rows
+                ],
+            }
+
+
+def read_conversations(path):
+    if path.endswith(".csv"):
+        return read_csv(path)
+    return read_jsonl(path)
+
+
+def _parse_bool(value):
+    return str(value).strip().lower() in ("1", "true", "t", "yes", "y")
+
+
+# -----------------------------
+# Lookup cache
+# -----------------------------
+class LookupCache:
+    # Natural key -> id for roles, statuses and owners. Roles and
+    # statuses are loaded once per run; afterwards only unseen keys reach the
+    # database.
+    def __init__(self):
+        self.roles = None
+        self.statuses = None
+        self.tenants = {}
+        self.tenant_users = {}
+        self.projects = {}
+
+    def load(self, cur):
+        cur.execute("SELECT msgrole_code, min(msgrole_id) FROM te_ai_message_role GROUP BY msgrole_code")
+        self.roles = dict(cur.fetchall())
+        cur.execute("SELECT msgsts_name, min(msgsts_id) FROM te_ai_message_status GROUP BY msgsts_name")
+        self.statuses = dict(cur.fetchall())
+        return self
+
+    def role_ids(self, cur, codes):
+        missing = {code for code in codes if code not in self.roles}
+        if missing:
+            self.roles.update(lookup_ids(
+                cur, "te_ai_message_role", "msgrole_id", "msgrole_code", missing,
+                extra_column="msgrole_display_name", extra=lambda code: ROLE_NAMES.get(code, code.title()),
+            ))
+        return self.roles
+
+    def status_ids(self, cur, names):
+        missing = {name for name in names if name not in self.statuses}
+        if missing:
+            self.statuses.update(lookup_ids(cur, "te_ai_message_status", "msgsts_id", "msgsts_name", missing))
+        return self.statuses
+
+    def owners(self, cur, owner_keys, now):
+        # (tenant, user_id, project) -> (tntu_id, pro_id), reusing existing rows
+        tenants = {tenant for tenant, _, _ in owner_keys if tenant not in self.tenants}
+        if tenants:
+            self.tenants.update(lookup_ids(cur, "te_ai_tenant", "tnt_id", "tnt_name", tenants))
+
+        user_keys = list(dict.fromkeys(
+            (self.tenants[tenant], user_id) for tenant, user_id, _ in owner_keys
+        ))
+        user_keys = [key for key in user_keys if key not in self.tenant_users]
+        if user_keys:
+            found = execute_values(cur, """
+                SELECT DISTINCT ON (tu.tntu_tnt_id, tu.tntu_u_id) tu.tntu_tnt_id, tu.tntu_u_id, tu.tntu_id::text
+                FROM te_ai_tenant_user tu
+                JOIN (VALUES %s) AS v(tnt_id, u_id) ON tu.tntu_tnt_id = v.tnt_id AND tu.tntu_u_id = v.u_id
+                ORDER BY tu.tntu_tnt_id, tu.tntu_u_id, tu.tntu_id
+            """, user_keys, fetch=True)
+            self.tenant_users.update(((tnt_id, u_id), tntu_id) for tnt_id, u_id, tntu_id in found)
+            missing = [key for key in user_keys if key not in self.tenant_users]
+            if missing:
+                new_ids = [str(uuid.uuid4()) for _ in missing]
+                execute_values(
+                    cur, "INSERT INTO te_ai_tenant_user (tntu_id, tntu_tnt_id, tntu_u_id) VALUES %s",
+                    [(tntu_id, tnt_id, u_id) for tntu_id, (tnt_id, u_id) in zip(new_ids, missing)],
+                )
+                self.tenant_users.update(zip(missing, new_ids))
+
+        def tntu_of(key):
+            tenant, user_id, _ = key
+            return self.tenant_users[(self.tenants[tenant], user_id)]
+
+        project_keys = list(dict.fromkeys((tntu_of(key), key[2]) for key in owner_keys))
+        project_keys = [key for key in project_keys if key not in self.projects]
+        if project_keys:
+            found = execute_values(cur, """
+                SELECT DISTINCT ON (p.pro_tntu_id, p.pro_title) p.pro_tntu_id::text, p.pro_title, p.pro_id
+                FROM te_ai_project p
+                JOIN (VALUES %s) AS v(tntu_id, title) ON p.pro_tntu_id::text = v.tntu_id AND p.pro_title = v.title
+                ORDER BY p.pro_tntu_id, p.pro_title, p.pro_id
+            """, project_keys, fetch=True)
+            self.projects.update(((tntu_id, title), pro_id) for tntu_id, title, pro_id in found)
+            missing = [key for key in project_keys if key not in self.projects]
+            if missing:
+                created = execute_values(
+                    cur, "INSERT INTO te_ai_project (pro_tntu_id, pro_title, pro_created) VALUES %s "
+                         "RETURNING pro_tntu_id::text, pro_title, pro_id",
+                    [(tntu_id, title, now.time()) for tntu_id, title in missing], fetch=True,
+                )
+                self.projects.update(((tntu_id, title), pro_id) for tntu_id, title, pro_id in created)
+
+        return {key: (tntu_of(key), self.projects[(tntu_of(key), key[2])]) for key in owner_keys}
+
+
+# -----------------------------
+# Ingestion
+# -----------------------------
+def ingest_conversations(conn, conversations, batch_size=500, commit=True, embed=None, upsert=False):
+    # -> totals per table; commits after every batch unless commit=False
+    totals = {"conversations": 0, "messages": 0, "skipped": 0, "memory": 0, "embedded": 0}
+    if embed is not None:
+        embed.prepare(conn)
+    if upsert:
+        check_upsert_schema(conn)
+    with conn.cursor() as cur:
+        cur.execute(STAGE_DDL)
+        cache = LookupCache().load(cur)
+        iterator = iter(conversations)
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                break
+            counts = ingest_batch(cur, batch, embed, cache=cache, upsert=upsert)
+            for key, value in counts.items():
+                totals[key] += value
+            if commit:
+                conn.commit()
+    return totals
+
+
+def ingest_batch(cur, batch, embed=None, cache=None, upsert=False):
+    if cache is None:
+        cache = LookupCache().load(cur)
+    now = datetime.now()
+    owners = cache.owners(cur, list(dict.fromkeys(_owner_key(c) for c in batch)), now)
+    if upsert:
+        batch, chat_hashes, cht_ids = _upsert_chats(cur, batch, owners, now)
+    else:
+        chat_hashes = [None] * len(batch)
+        cht_ids = next_ids(cur, "te_ai_chat", "cht_id", len(batch))
+        execute_values(cur, "INSERT INTO te_ai_chat (cht_id, cht_pro_id, cht_created) VALUES %s", [
+            (cht_id, owners[_owner_key(c)][1], c.get("created") or now) for cht_id, c in zip(cht_ids, batch)
+        ])
+
+    roles = cache.role_ids(cur, {m["role"] for c in batch for m in c["messages"]})
+    statuses = cache.status_ids(cur, {m.get("status") or "completed" for c in batch for m in c["messages"]})
+
+    stage = []
+    for conversation, chat_hash, cht_id in zip(batch, chat_hashes, cht_ids):
+        tntu_id, pro_id = owners[_owner_key(conversation)]
+        for position, message in enumerate(conversation["messages"]):
+            text = message["text"]
+            memory = message.get("memory")
+            stage.append((
+                len(stage), cht_id, pro_id, tntu_id, roles[message["role"]],
+                statuses[message.get("status") or "completed"], text,
+                message.get("lang") or conversation.get("lang") or "en", len(text.split()),
+                message["role"] in MEMORY_ROLES if memory is None else bool(memory),
+                None if chat_hash is None else message_hash(chat_hash, position, message),
+            ))
+
+    cur.execute("TRUNCATE ingest_message_stage")
+    copy_rows(cur, "ingest_message_stage", STAGE_COLUMNS, stage)
+    if upsert:
+        for sql in UPSERT_MATCH_SQL:
+            cur.execute(sql)
+        cur.execute(UPSERT_MESSAGE_SQL)
+        inserted = cur.rowcount
+        cur.execute(UPSERT_STATUS_SQL)
+        cur.execute(UPSERT_CANONICAL_SQL)
+        canonical = cur.fetchall()
+        cur.execute(UPSERT_MEMORY_SQL)
+    else:
+        for sql in LINK_SQL:
+            cur.execute(sql)
+        inserted = len(stage)
+        cur.execute(CANONICAL_SQL)
+        canonical = cur.fetchall()
+        cur.execute(MEMORY_SQL)
+    memory = cur.rowcount
+    return {
+        "conversations": len(batch),
+        "messages": inserted,
+        "skipped": len(stage) - inserted,
+        "memory": memory,
+        "embedded": embed(cur, canonical) if embed is not None else 0,
+    }
+
+
+def _upsert_chats(cur, batch, owners, now):
+    # -> (conversations, chat hashes, cht_ids); a conversation repeated within
+    # the batch is ingested once
+    by_hash = {}
+    for conversation in batch:
+        by_hash.setdefault(conversation_hash(conversation), conversation)
+    hashes = list(by_hash)
+    execute_values(cur, """
+        INSERT INTO te_ai_chat (cht_pro_id, cht_created, cht_content_hash) VALUES %s
+        ON CONFLICT (cht_content_hash) WHERE cht_content_hash IS NOT NULL DO NOTHING
+    """, [(owners[_owner_key(c)][1], c.get("created") or now, h) for h, c in by_hash.items()])
+    cur.execute("SELECT cht_content_hash, cht_id FROM te_ai_chat WHERE cht_content_hash = ANY(%s)", (hashes,))
+    cht_ids = dict(cur.fetchall())
+    return list(by_hash.values()), hashes, [cht_ids[h] for h in hashes]
+
+
+def _owner_key(conversation):
+    return conversation["tenant"], int(conversation["user_id"]), conversation["project"]
+
+
+def column_exists(conn, table, column):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+            (table, column),
+        )
+        found = cur.fetchone() is not None
+    conn.rollback()
+    return found
+
+
+def next_ids(cur, table, column, n):
+    # Reserve n ids from the column's sequence, in order, for an explicit-id insert
+    cur.execute(f"SELECT nextval(pg_get_serial_sequence('{table}', '{column}')) FROM generate_series(1, %s)", (n,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def lookup_ids(cur, table, id_column, key_column, keys, extra_column=None, extra=None):
+    # Get-or-create lookup rows by their natural key -> {key: id}
+    keys = sorted(keys)
+    cur.execute(
+        f"SELECT {key_column}, min({id_column}) FROM {table} WHERE {key_column} = ANY(%s) GROUP BY {key_column}",
+        (keys,),
+    )
+    ids = dict(cur.fetchall())
+    missing = [key for key in keys if key not in ids]
+    if missing:
+        if extra_column:
+            sql = f"INSERT INTO {table} ({key_column}, {extra_column}) VALUES %s RETURNING {key_column}, {id_column}"
+            rows = [(key, extra(key)) for key in missing]
+        else:
+            sql = f"INSERT INTO {table} ({key_column}) VALUES %s RETURNING {key_column}, {id_column}"
+            rows = [(key,) for key in missing]
+        ids.update(execute_values(cur, sql, rows, fetch=True))
+    return ids
+
+
+def copy_rows(cur, table, columns, rows):
+    # COPY ... FROM STDIN in the default text format (tab separated, \N = NULL)
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(v) for v in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+import pgvector_index
+from ingest import column_exists
+
+
+# -----------------------------
+# Embedding stage for ingested canonical rows
+# -----------------------------
+# Plugged into ingest.ingest_conversations(..., embed=EmbeddingStage(model)).
+# `model` is any local encoder with the SentenceTransformer interface
+# (encode(texts, batch_size=..., convert_to_numpy=True, normalize_embeddings=True)
+# and get_sentence_embedding_dimension()), e.g. encoder.Encoder.
+#
+#   mode="inline"  new canonical texts are encoded in batch_size chunks on a
+#                  thread pool and written back with one bulk UPDATE per page,
+#                  inside the ingest transaction: rows are searchable by
+#                  vector_search as soon as the batch commits
+#   mode="outbox"  only the new cantxt_ids are queued in OUTBOX_TABLE (same
+#                  transaction); drain_outbox() encodes them later, from any
+#                  number of worker processes (FOR UPDATE SKIP LOCKED)
+#
+# The vector column / outbox table are created once by setup() (a migration:
+# it takes table locks and needs DDL rights), not on every ingest run.
+
+MODES = ("inline", "outbox")
+
+OUTBOX_TABLE = "te_ai_embedding_outbox"
+
+OUTBOX_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {OUTBOX_TABLE} (
+        cantxt_id bigint PRIMARY KEY,
+        enqueued_at timestamptz NOT NULL DEFAULT now()
+    )
+"""
+
+CLAIM_QUERY = f"""
+    SELECT o.cantxt_id, c.cantxt_content_text
+    FROM {OUTBOX_TABLE} o
+    JOIN {pgvector_index.TABLE} c ON c.cantxt_id = o.cantxt_id
+    ORDER BY o.cantxt_id
+    LIMIT %s
+    FOR UPDATE OF o SKIP LOCKED
+"""
+
+
+class EmbeddingStage:
+    def __init__(self, model, batch_size=256, workers=2, mode="inline"):
+        if mode not in MODES:
+            raise ValueError(f"unknown embedding stage mode: {mode}")
+        self.model = model
+        self.batch_size = batch_size
+        self.mode = mode
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-encode")
+
+    def setup(self, conn):
+        # One-off migration: schema the stage writes to
+        if self.mode == "inline":
+            pgvector_index.ensure_vector_column(conn, self.model.get_sentence_embedding_dimension())
+        else:
+            ensure_outbox(conn)
+
+    def prepare(self, conn):
+        # Called before ingesting: fail fast if setup() has not been run
+        table, column = (
+            (pgvector_index.TABLE, pgvector_index.COLUMN) if self.mode == "inline" else (OUTBOX_TABLE, "cantxt_id")
+        )
+        if not column_exists(conn, table, column):
+            raise RuntimeError(f"{table}.{column} does not exist: run `python insert-data.py --setup "
+                               f"--embed {self.mode}` (the embedding stage setup()) first")
+
+    def encode(self, texts):
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if not chunks:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        vectors = self._executor.map(
+            lambda chunk: self.model.encode(
+                [t or "" for t in chunk], batch_size=self.batch_size, convert_to_numpy=True,
+                normalize_embeddings=True,
+            ),
+            chunks,
+        )
+        return np.vstack(list(vectors)).astype(np.float32, copy=False)
+
+    def __call__(self, cur, rows):
+        # rows: (cantxt_id, cantxt_content_text) of the canonical rows just inserted
+        if not rows:
+            return 0
+        ids = [r[0] for r in rows]
+        if self.mode == "outbox":
+            execute_values(
+                cur, f"INSERT INTO {OUTBOX_TABLE} (cantxt_id) VALUES %s ON CONFLICT DO NOTHING",
+                [(cantxt_id,) for cantxt_id in ids], page_size=self.batch_size,
+            )
+        else:
+            pgvector_index.write_embeddings(cur, ids, self.encode([r[1] for r in rows]), page_size=self.batch_size)
+        return len(ids)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def ensure_outbox(conn):
+    with conn.cursor() as cur:
+        cur.execute(OUTBOX_DDL)
+    conn.commit()
+
+
+def drain_outbox(conn, stage, limit=None):
+    # Encodes queued rows batch by batch, each batch committed with its
+    # outbox entries removed; returns the number of rows embedded
+    done = 0
+    while limit is None or done < limit:
+        size = stage.batch_size if limit is None else min(stage.batch_size, limit - done)
+        with conn.cursor() as cur:
+            cur.execute(CLAIM_QUERY, (size,))
+            rows = cur.fetchall()
+            if not rows:
+                conn.rollback()
+                break
+            ids = [r[0] for r in rows]
+            pgvector_index.write_embeddings(cur, ids, stage.encode([r[1] for r in rows]), page_size=size)
+            cur.execute(f"DELETE FROM {OUTBOX_TABLE} WHERE cantxt_id = ANY(%s)", (ids,))
+        conn.commit()
+        done += len(rows)
+    return done
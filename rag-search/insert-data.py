@@ -1,111 +1,180 @@
+import argparse
+import time
+
 import psycopg2
-import uuid
-from datetime import datetime
 
-def insert_dental_conversation():
-    conn = psycopg2.connect(
-        dbname="ai_memory",
-        user="admin",
-        password="xxx",
-        host="0.0.0.0",
-        port="5434"
+from encoder import Encoder
+from ingest import ensure_upsert_schema, ingest_conversations, read_conversations
+from ingest_embeddings import EmbeddingStage, drain_outbox
+
+
+# -----------------------------
+# Conversation loader
+# -----------------------------
+#   python insert-data.py --setup          once per database, and again after
+#                                          changing EMBED_CONFIG / --embed
+#   python insert-data.py [files ...]      example conversation, or JSONL / CSV
+#                                          dumps (see ingest.py)
+#
+# Prerequisites with the defaults (UPSERT, EMBED_CONFIG mode "inline"):
+#   - `--setup` has run: it adds the content-hash columns and unique indexes
+#     upsert relies on and, for inline embeddings, the pgvector column; an
+#     ingest run only checks for them and stops with a pointer to `--setup`
+#   - the pgvector extension is available to the database and
+#     sentence-transformers is installed (inline / outbox embeddings)
+# `--embed none --no-upsert` needs neither: a plain bulk insert into the
+# base schema.
+DB_CONFIG = {
+    "dbname": "ai_memory",
+    "user": "admin",
+    "password": "xxx",
+    "host": "0.0.0.0",
+    "port": "5434"
+}
+
+# Conversations per bulk batch (one COPY + set-based linking each, see ingest.py)
+BATCH_SIZE = 500
+
+# Idempotent ingestion: replays reuse tenants / users / projects / roles /
+# statuses and skip chats and messages already loaded (content hashes; the
+# columns and indexes come from `insert-data.py --setup`)
+UPSERT = True
+
+# Embeddings for new canonical rows (see ingest_embeddings.py): mode "inline"
+# writes them in the ingest transaction, "outbox" queues the ids for
+# `insert-data.py --drain-outbox`, None skips the stage. The model must match
+# search-script.py's MODEL_NAME. Run `insert-data.py --setup` once first.
+EMBED_CONFIG = {
+    "mode": "inline",
+    "model_name": "all-MiniLM-L6-v2",
+    "batch_size": 256,
+    "workers": 2,
+}
+
+DENTAL_CONVERSATION = {
+    "id": "dental-example",
+    "tenant": "Dental Clinic",
+    "user_id": 101,
+    "project": "AI Dental Assistant",
+    "lang": "en",
+    "messages": [
+        {"role": role, "text": text}
+        for role, text in [
+            ("user", "Doctor, I have severe tooth pain in my lower left molar."),
+            ("assistant", "Sounds like tooth #36 may be infected. When did the pain start?"),
+            ("user", "It started two days ago, and it hurts when I eat sweets."),
+            ("assistant", "That indicates possible tooth decay. Do you also feel pain while drinking cold water?"),
+            ("user", "Yes, cold drinks make it worse."),
+            ("assistant", "Alright. Have you taken any painkillers so far?"),
+            ("user", "Yes, I took ibuprofen, but the pain still comes back."),
+            ("assistant", "Understood. Do you notice any swelling in your gums near that tooth?"),
+            ("user", "Yes, the gum around the tooth feels swollen."),
+            ("assistant", "This could be an abscess. We may need to do an X-ray."),
+            ("user", "Okay, can we do that tomorrow morning?"),
+            ("assistant", "Yes, we’ll schedule an X-ray at 10 AM. Are you available then?"),
+            ("user", "Yes, 10 AM works for me."),
+            ("assistant", "Good. Based on your symptoms, you might need a root canal treatment."),
+            ("user", "Is root canal painful? I am worried."),
+            ("assistant", "We use local anesthesia, so you won’t feel pain during the procedure."),
+            ("user", "How long does it take?"),
+            ("assistant", "Usually 1–2 hours depending on complexity. Sometimes two visits are needed."),
+            ("user", "Okay, please book me for the root canal after the X-ray."),
+            ("assistant", "Done. I have scheduled your X-ray tomorrow and the root canal session afterward."),
+        ]
+    ],
+}
+
+
+def embedding_stage(mode=EMBED_CONFIG["mode"]):
+    if mode is None:
+        return None
+    return EmbeddingStage(
+        Encoder(EMBED_CONFIG["model_name"]), batch_size=EMBED_CONFIG["batch_size"],
+        workers=EMBED_CONFIG["workers"], mode=mode,
     )
-    cur = conn.cursor()
-
-    cur.execute("INSERT INTO te_ai_tenant (tnt_name) VALUES (%s) RETURNING tnt_id", ("Dental Clinic",))
-    tnt_id = cur.fetchone()[0]
-
-    # 2. Tenant User (Dentist)
-    tntu_id = str(uuid.uuid4())
-    cur.execute("""
-        INSERT INTO te_ai_tenant_user (tntu_id, tntu_tnt_id, tntu_u_id)
-        VALUES (%s, %s, %s) RETURNING tntu_id
-    """, (tntu_id, tnt_id, 101))
-
-    # 3. Project
-    cur.execute("""
-        INSERT INTO te_ai_project (pro_tntu_id, pro_title, pro_created)
-        VALUES (%s, %s, %s) RETURNING pro_id
-    """, (tntu_id, "AI Dental Assistant", datetime.now().time()))
-    pro_id = cur.fetchone()[0]
-
-    # 4. Chat
-    cur.execute("""
-        INSERT INTO te_ai_chat (cht_pro_id, cht_created)
-        VALUES (%s, %s) RETURNING cht_id
-    """, (pro_id, datetime.now()))
-    cht_id = cur.fetchone()[0]
-
-    # 5. Roles
-    cur.execute("INSERT INTO te_ai_message_role (msgrole_code, msgrole_display_name) VALUES (%s, %s) RETURNING msgrole_id",
-                ("user", "Patient"))
-    patient_role = cur.fetchone()[0]
-
-    cur.execute("INSERT INTO te_ai_message_role (msgrole_code, msgrole_display_name) VALUES (%s, %s) RETURNING msgrole_id",
-                ("assistant", "Dentist"))
-    dentist_role = cur.fetchone()[0]
-
-    # 6. Status
-    cur.execute("INSERT INTO te_ai_message_status (msgsts_name) VALUES (%s) RETURNING msgsts_id", ("completed",))
-    msgsts_id = cur.fetchone()[0]
-
-    # -------------------
-    # MULTIPLE MESSAGES
-    # -------------------
-
-    messages = [
-    (patient_role, "Doctor, I have severe tooth pain in my lower left molar."),
-    (dentist_role, "Sounds like tooth #36 may be infected. When did the pain start?"),
-    (patient_role, "It started two days ago, and it hurts when I eat sweets."),
-    (dentist_role, "That indicates possible tooth decay. Do you also feel pain while drinking cold water?"),
-    (patient_role, "Yes, cold drinks make it worse."),
-    (dentist_role, "Alright. Have you taken any painkillers so far?"),
-    (patient_role, "Yes, I took ibuprofen, but the pain still comes back."),
-    (dentist_role, "Understood. Do you notice any swelling in your gums near that tooth?"),
-    (patient_role, "Yes, the gum around the tooth feels swollen."),
-    (dentist_role, "This could be an abscess. We may need to do an X-ray."),
-    (patient_role, "Okay, can we do that tomorrow morning?"),
-    (dentist_role, "Yes, we’ll schedule an X-ray at 10 AM. Are you available then?"),
-    (patient_role, "Yes, 10 AM works for me."),
-    (dentist_role, "Good. Based on your symptoms, you might need a root canal treatment."),
-    (patient_role, "Is root canal painful? I am worried."),
-    (dentist_role, "We use local anesthesia, so you won’t feel pain during the procedure."),
-    (patient_role, "How long does it take?"),
-    (dentist_role, "Usually 1–2 hours depending on complexity. Sometimes two visits are needed."),
-    (patient_role, "Okay, please book me for the root canal after the X-ray."),
-    (dentist_role, "Done. I have scheduled your X-ray tomorrow and the root canal session afterward."),
-]
-
-
-    message_ids = []
-    for role_id, text in messages:
-        cur.execute("""
-            INSERT INTO te_ai_message (msg_cht_id, msg_msgrole_id, msg_content_text, msg_msgsts_id)
-            VALUES (%s, %s, %s, %s) RETURNING msg_id
-        """, (cht_id, role_id, text, msgsts_id))
-        message_ids.append(cur.fetchone()[0])
-
-    # Canonical Data + Memory for each patient message
-    for i, msg_id in enumerate(message_ids):
-        cur.execute("""
-            INSERT INTO te_ai_canonical_data (
-                cantxt_tntu_id, cantxt_type, cantxt_source_id, 
-                cantxt_content_text, cantxt_lang, cantxt_n_tokens, cantxt_pii_level, cantxt_srctyp_id
-            ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s) RETURNING cantxt_id
-        """, (tntu_id, "text", msg_id, messages[i][1], "en", len(messages[i][1].split()), "low", 1))
-        cantxt_id = cur.fetchone()[0]
-
-        if messages[i][0] == patient_role:  # only store facts for patient messages
-            cur.execute("""
-                INSERT INTO te_ai_memory (mem_tntu_id, mem_pro_id, mem_cht_id, mem_text, mem_type, mem_confidence, mem_source_type)
-                VALUES (%s,%s,%s,%s,%s,%s,%s)
-            """, (tntu_id, pro_id, cht_id, messages[i][1], "patient_note", 0.9, "message"))
-
-    conn.commit()
-    print("Inserted dental conversation with multiple messages ✅")
-
-    cur.close()
-    conn.close()
+
+
+def setup_schema(embed_mode=EMBED_CONFIG["mode"]):
+    # Migration, run once (or after changing EMBED_CONFIG) before ingesting:
+    # the DDL takes table locks and needs schema privileges
+    conn = psycopg2.connect(**DB_CONFIG)
+    embed = embedding_stage(embed_mode)
+    try:
+        ensure_upsert_schema(conn)
+        if embed is not None:
+            embed.setup(conn)
+    finally:
+        if embed is not None:
+            embed.close()
+        conn.close()
+    print("Ingest schema is up to date")
+
+
+def insert_conversations(conversations, batch_size=BATCH_SIZE, embed_mode=EMBED_CONFIG["mode"], upsert=UPSERT):
+    conn = psycopg2.connect(**DB_CONFIG)
+    embed = embedding_stage(embed_mode)
+    try:
+        return ingest_conversations(conn, conversations, batch_size=batch_size, embed=embed, upsert=upsert)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if embed is not None:
+            embed.close()
+        conn.close()
+
+
+def drain_embedding_outbox(limit=None):
+    conn = psycopg2.connect(**DB_CONFIG)
+    stage = embedding_stage("outbox")
+    try:
+        done = drain_outbox(conn, stage, limit=limit)
+    finally:
+        stage.close()
+        conn.close()
+    print(f"Embedded {done} queued canonical rows")
+    return done
+
+
+def insert_dental_conversation():
+    # Tenant, dentist user, project, chat, roles, status, messages, canonical
+    # data and patient memory notes for one example conversation; re-running
+    # it adds nothing
+    totals = insert_conversations([DENTAL_CONVERSATION])
+    print(f"Inserted dental conversation with {totals['messages']} new messages "
+          f"({totals['skipped']} already present) ✅")
+
+
+def insert_files(paths, batch_size=BATCH_SIZE, embed_mode=EMBED_CONFIG["mode"], upsert=UPSERT):
+    # JSONL / CSV conversation dumps, see ingest.py for the formats
+    for path in paths:
+        started = time.perf_counter()
+        totals = insert_conversations(
+            read_conversations(path), batch_size=batch_size, embed_mode=embed_mode, upsert=upsert,
+        )
+        elapsed = time.perf_counter() - started
+        print(f"{path}: {totals['conversations']} conversations, {totals['messages']} new messages "
+              f"({totals['skipped']} skipped), {totals['memory']} memory rows, "
+              f"{totals['embedded']} embedded in {elapsed:.1f}s")
+
 
 if __name__ == "__main__":
-    insert_dental_conversation()
+    parser = argparse.ArgumentParser(description="Load conversations into the ai_memory database")
+    parser.add_argument("files", nargs="*", help="JSONL or CSV conversation files (default: example conversation)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--embed", choices=["inline", "outbox", "none"], default=EMBED_CONFIG["mode"] or "none",
+                        help="how new canonical rows get their embedding")
+    parser.add_argument("--no-upsert", action="store_true",
+                        help="plain bulk insert: no dedup, every run creates new rows")
+    parser.add_argument("--setup", action="store_true", help="create the schema ingestion writes to and exit")
+    parser.add_argument("--drain-outbox", action="store_true", help="embed rows queued by --embed outbox and exit")
+    args = parser.parse_args()
+    embed_mode = None if args.embed == "none" else args.embed
+    if args.setup:
+        setup_schema(embed_mode)
+    elif args.drain_outbox:
+        drain_embedding_outbox()
+    elif args.files:
+        insert_files(args.files, batch_size=args.batch_size, embed_mode=embed_mode, upsert=not args.no_upsert)
+    else:
+        insert_dental_conversation()
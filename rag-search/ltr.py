@@ -0,0 +1,168 @@
+import json
+import os
+import pickle
+from datetime import datetime
+
+import numpy as np
+
+from topk import top_k
+
+
+# -----------------------------
+# Learning-to-rank reranker for canonical data
+# -----------------------------
+# Stage 1 (cheap, elsewhere): BM25 + embedding candidates, a few hundred rows.
+# Stage 2 (here): one vectorized feature matrix for the candidates, scored
+# by a small model loaded from disk:
+#   *.json         LinearRanker  {"features": [...], "weights": [...], "bias": b}
+#   *.pkl          any pickled model with .predict(X), e.g. a scikit-learn
+#                  HistGradientBoostingRegressor / LightGBM ranker
+# Without a model file a LinearRanker with DEFAULT_WEIGHTS is used.
+
+FEATURES = (
+    "tfidf_cosine",
+    "embedding_cosine",
+    "bm25",
+    "recency",
+    "log_n_tokens",
+    "lang_match",
+    "pii_level",
+)
+
+DEFAULT_WEIGHTS = {
+    "tfidf_cosine": 1.0,
+    "embedding_cosine": 2.0,
+    "bm25": 0.1,
+    "recency": 0.2,
+    "log_n_tokens": 0.05,
+    "lang_match": 0.5,
+    "pii_level": -0.1,
+}
+
+PII_LEVELS = {"none": 0.0, "low": 1.0, "medium": 2.0, "high": 3.0}
+
+RECENCY_HALF_LIFE_DAYS = 30.0
+
+CANDIDATE_QUERY = """
+    SELECT c.cantxt_id, c.cantxt_content_text, c.cantxt_source_id, c.cantxt_n_tokens,
+           c.cantxt_lang, c.cantxt_pii_level, ch.cht_created
+    FROM te_ai_canonical_data c
+    LEFT JOIN te_ai_message m ON m.msg_id = c.cantxt_source_id
+    LEFT JOIN te_ai_chat ch ON ch.cht_id = m.msg_cht_id
+    WHERE c.cantxt_id = ANY(%s) OR c.cantxt_source_id = ANY(%s)
+"""
+
+
+class LinearRanker:
+    def __init__(self, weights, bias=0.0, features=FEATURES):
+        self.features = tuple(features)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+
+    @classmethod
+    def default(cls):
+        return cls([DEFAULT_WEIGHTS[f] for f in FEATURES])
+
+    def predict(self, X):
+        return X @ self.weights + self.bias
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"features": list(self.features), "weights": self.weights.tolist(), "bias": self.bias}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if tuple(data["features"]) != FEATURES:
+            raise ValueError(f"ranker {path} was trained on features {data['features']}, expected {list(FEATURES)}")
+        return cls(data["weights"], data.get("bias", 0.0), data["features"])
+
+
+def load_ranker(path):
+    if not path or not os.path.exists(path):
+        return LinearRanker.default()
+    if path.endswith(".json"):
+        return LinearRanker.load(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def train_ranker(X, y, kind="linear", path=None):
+    # X: [n, len(FEATURES)] from feature_matrix, y: graded relevance labels
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    if kind == "linear":
+        A = np.hstack([X, np.ones((len(X), 1), dtype=np.float32)])
+        coef, *_ = np.linalg.lstsq(A, y, rcond=None)
+        ranker = LinearRanker(coef[:-1], coef[-1])
+        if path:
+            ranker.save(path)
+    elif kind == "gbdt":
+        from sklearn.ensemble import HistGradientBoostingRegressor
+
+        ranker = HistGradientBoostingRegressor(max_iter=200, max_depth=4, learning_rate=0.1)
+        ranker.fit(X, y)
+        if path:
+            with open(path, "wb") as f:
+                pickle.dump(ranker, f)
+    else:
+        raise ValueError(f"unknown ranker kind: {kind}")
+    return ranker
+
+
+# -----------------------------
+# Features
+# -----------------------------
+def fetch_candidates(conn, cantxt_ids, msg_ids):
+    with conn.cursor() as cur:
+        cur.execute(CANDIDATE_QUERY, (list(cantxt_ids), list(msg_ids)))
+        rows = cur.fetchall()
+    conn.rollback()
+    return rows
+
+
+def feature_matrix(query_text, query_emb, rows, doc_embeddings, vectorizer=None, bm25_scores=None,
+                   lang=None, now=None):
+    # rows: CANDIDATE_QUERY rows; doc_embeddings: [n, dim] L2-normalized, row-aligned
+    n = len(rows)
+    X = np.zeros((n, len(FEATURES)), dtype=np.float32)
+    if not n:
+        return X
+    texts = [r[1] or "" for r in rows]
+
+    if vectorizer is not None:
+        docs = vectorizer.transform(texts)
+        query_vec = vectorizer.transform([query_text])
+        X[:, 0] = (docs @ query_vec.T).toarray().ravel()
+
+    X[:, 1] = np.asarray(doc_embeddings, dtype=np.float32) @ np.asarray(query_emb, dtype=np.float32)
+
+    if bm25_scores:
+        X[:, 2] = [bm25_scores.get(r[2], 0.0) for r in rows]
+
+    age_days = np.array([_age_days(r[6], now) for r in rows], dtype=np.float32)
+    X[:, 3] = np.exp2(-np.maximum(age_days, 0.0) / RECENCY_HALF_LIFE_DAYS)
+
+    n_tokens = np.array([r[3] if r[3] is not None else len(texts[i].split()) for i, r in enumerate(rows)],
+                        dtype=np.float32)
+    X[:, 4] = np.log1p(n_tokens)
+    if lang is not None:
+        X[:, 5] = [1.0 if r[4] == lang else 0.0 for r in rows]
+    X[:, 6] = [PII_LEVELS.get((r[5] or "").lower(), 0.0) for r in rows]
+    return X
+
+
+def _age_days(created, now=None):
+    if not isinstance(created, datetime):
+        return np.inf
+    now = now or datetime.now(created.tzinfo)
+    return (now - created).total_seconds() / 86400.0
+
+
+def rerank(ranker, rows, X, k=5):
+    if not len(rows):
+        return []
+    scores = np.asarray(ranker.predict(X), dtype=np.float64)
+    idx, values = top_k(scores, k)
+    return [(rows[i][0], rows[i][1], float(v)) for i, v in zip(idx, values)]
@@ -0,0 +1,231 @@
+import math
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+
+# -----------------------------
+# pgvector ANN index management for te_ai_canonical_data.embedding
+# -----------------------------
+# - ensure_vector_column / create_index / reindex: schema + HNSW or IVFFlat index
+# - backfill_embeddings: fills NULL embeddings in keyset-paginated batches
+#   (write_embeddings is the bulk UPDATE shared with ingest_embeddings.py)
+# - ann_search: ORDER BY embedding <op> query LIMIT k with per-query
+#   ef_search (HNSW) / probes (IVFFlat) recall-vs-latency knobs
+#
+# The distance operator in ann_search must match the opclass the index was
+# built with, otherwise Postgres cannot use the index and scans the table.
+
+TABLE = "te_ai_canonical_data"
+COLUMN = "embedding"
+
+METRICS = {
+    # metric: (distance operator, opclass)
+    "l2": ("<->", "vector_l2_ops"),
+    "cosine": ("<=>", "vector_cosine_ops"),
+    "ip": ("<#>", "vector_ip_ops"),
+}
+
+
+# pgvector caps hnsw.ef_search at this value
+MAX_EF_SEARCH = 1000
+
+# Result of supports_iterative_scan(), read once per process
+_iterative_scan = None
+
+
+def index_name(method, metric):
+    return f"{TABLE}_{COLUMN}_{method}_{metric}_idx"
+
+
+def to_vector_literal(vec):
+    return "[" + ",".join(repr(float(x)) for x in np.asarray(vec, dtype=np.float32).ravel()) + "]"
+
+
+# -----------------------------
+# Schema / index maintenance
+# -----------------------------
+def ensure_vector_column(conn, dim):
+    with conn.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        cur.execute(f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS {COLUMN} vector({int(dim)})")
+    conn.commit()
+
+
+def ivfflat_lists(n_rows):
+    # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) above that
+    if n_rows <= 1_000_000:
+        return max(n_rows // 1000, 1)
+    return int(math.sqrt(n_rows))
+
+
+def create_index(conn, method="hnsw", metric="cosine", m=16, ef_construction=64, lists=None,
+                 maintenance_work_mem="1GB", concurrently=True):
+    if method not in ("hnsw", "ivfflat"):
+        raise ValueError(f"unknown index method: {method}")
+    _, opclass = METRICS[metric]
+    name = index_name(method, metric)
+
+    autocommit = conn.autocommit
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = concurrently
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+            if method == "hnsw":
+                options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+            else:
+                if lists is None:
+                    cur.execute(f"SELECT count(*) FROM {TABLE} WHERE {COLUMN} IS NOT NULL")
+                    lists = ivfflat_lists(cur.fetchone()[0])
+                options = f"lists = {int(lists)}"
+            cur.execute(f"""
+                CREATE INDEX {"CONCURRENTLY" if concurrently else ""} IF NOT EXISTS {name}
+                ON {TABLE} USING {method} ({COLUMN} {opclass})
+                WITH ({options})
+            """)
+            cur.execute("RESET maintenance_work_mem")
+        if not concurrently:
+            conn.commit()
+    finally:
+        conn.autocommit = autocommit
+    return name
+
+
+def drop_index(conn, method="hnsw", metric="cosine"):
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name(method, metric)}")
+    finally:
+        conn.autocommit = autocommit
+
+
+def reindex(conn, method="ivfflat", metric="cosine"):
+    # IVFFlat centroids are fixed at build time; rebuild after large data drift
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"REINDEX INDEX CONCURRENTLY {index_name(method, metric)}")
+    finally:
+        conn.autocommit = autocommit
+
+
+def index_status(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT i.indexname, i.indexdef, ix.indisvalid
+            FROM pg_indexes i
+            JOIN pg_class c ON c.relname = i.indexname
+            JOIN pg_index ix ON ix.indexrelid = c.oid
+            WHERE i.tablename = %s AND i.indexdef ILIKE %s
+        """, (TABLE, f"%({COLUMN} %"))
+        rows = cur.fetchall()
+    conn.rollback()
+    return [{"name": r[0], "definition": r[1], "valid": r[2]} for r in rows]
+
+
+# -----------------------------
+# Embedding backfill
+# -----------------------------
+def write_embeddings(cur, cantxt_ids, vectors, page_size=256):
+    # Bulk UPDATE of the embedding column, one statement per page_size rows
+    execute_values(cur, f"""
+        UPDATE {TABLE} AS t SET {COLUMN} = v.emb::vector
+        FROM (VALUES %s) AS v(id, emb)
+        WHERE t.cantxt_id = v.id
+    """, [(cantxt_id, to_vector_literal(v)) for cantxt_id, v in zip(cantxt_ids, vectors)], page_size=page_size)
+
+
+def backfill_embeddings(conn, model, batch_size=256, limit=None):
+    # Keyset pagination over rows with a NULL embedding; every batch is
+    # committed on its own so an interrupted backfill resumes where it stopped
+    done = 0
+    last_id = None
+    while limit is None or done < limit:
+        size = batch_size if limit is None else min(batch_size, limit - done)
+        with conn.cursor() as cur:
+            if last_id is None:
+                cur.execute(f"""
+                    SELECT cantxt_id, cantxt_content_text FROM {TABLE}
+                    WHERE {COLUMN} IS NULL ORDER BY cantxt_id LIMIT %s
+                """, (size,))
+            else:
+                cur.execute(f"""
+                    SELECT cantxt_id, cantxt_content_text FROM {TABLE}
+                    WHERE {COLUMN} IS NULL AND cantxt_id > %s ORDER BY cantxt_id LIMIT %s
+                """, (last_id, size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            vectors = model.encode(
+                [r[1] or "" for r in rows],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            write_embeddings(cur, [r[0] for r in rows], vectors, page_size=batch_size)
+        conn.commit()
+        done += len(rows)
+        last_id = rows[-1][0]
+    return done
+
+
+# -----------------------------
+# Query
+# -----------------------------
+def supports_iterative_scan(conn):
+    # hnsw.iterative_scan / ivfflat.iterative_scan exist from pgvector 0.8 on;
+    # older versions reject the SET
+    global _iterative_scan
+    if _iterative_scan is None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cur.fetchone()
+        conn.rollback()
+        version = tuple(int(part) for part in row[0].split(".")[:2] if part.isdigit()) if row else ()
+        _iterative_scan = version >= (0, 8)
+    return _iterative_scan
+
+
+def set_search_params(cur, ef_search=None, probes=None, iterative_scan=None, force_index=True):
+    # SET LOCAL only lasts for the current transaction, so pooled
+    # connections go back with the server defaults
+    if ef_search is not None:
+        cur.execute("SET LOCAL hnsw.ef_search = %s", (int(ef_search),))
+    if probes is not None:
+        cur.execute("SET LOCAL ivfflat.probes = %s", (int(probes),))
+    if iterative_scan is not None:
+        # pgvector >= 0.8 ("strict_order" / "relaxed_order"; IVFFlat only has
+        # the latter): keep scanning the index until rows passing a WHERE
+        # filter fill the LIMIT
+        method = "ivfflat" if probes is not None and ef_search is None else "hnsw"
+        cur.execute(f"SET LOCAL {method}.iterative_scan = %s", (iterative_scan,))
+    if force_index:
+        cur.execute("SET LOCAL enable_seqscan = off")
+
+
+def ann_search(conn, query_embedding, k=5, metric="cosine", ef_search=None, probes=None,
+               iterative_scan=None, where=None, params=(), columns="cantxt_id, cantxt_content_text",
+               force_index=True):
+    op, _ = METRICS[metric]
+    vector = to_vector_literal(query_embedding)
+    where_sql = f"WHERE {where}" if where else ""
+    if ef_search is not None:
+        # An HNSW scan returns at most ef_search rows, whatever the LIMIT
+        ef_search = min(max(int(ef_search), int(k)), MAX_EF_SEARCH)
+    with conn.cursor() as cur:
+        set_search_params(cur, ef_search=ef_search, probes=probes, iterative_scan=iterative_scan,
+                          force_index=force_index)
+        cur.execute(f"""
+            SELECT {columns}, {COLUMN} {op} %s::vector AS distance
+            FROM {TABLE}
+            {where_sql}
+            ORDER BY {COLUMN} {op} %s::vector
+            LIMIT %s
+        """, (vector, *params, vector, int(k)))
+        rows = cur.fetchall()
+    conn.rollback()
+    return rows
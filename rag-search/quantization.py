@@ -0,0 +1,91 @@
+import numpy as np
+
+
+# -----------------------------
+# Quantized storage for L2-normalized embedding matrices
+# -----------------------------
+#   float32  no quantization                                  (1x)
+#   float16  half precision, scored in float32 blocks         (2x smaller)
+#   int8     per-dimension symmetric int8, x ~= code * scale  (4x smaller)
+#   binary   sign bits packed 8 per byte                      (32x smaller)
+#
+# float16 / int8 codes are scored directly (q * scale) @ codes.T. Binary codes
+# only give a Hamming-distance pre-filter: the closest candidates are then
+# rescored exactly with their float32 rows, which stay on disk (memmap) and
+# are read only for those candidates.
+
+QUANTIZATIONS = ("float32", "float16", "int8", "binary")
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def quantize(embeddings, method, chunk_size=65536):
+    # -> (codes, scale); scale is None except for int8. Works chunk by chunk so
+    # a memory-mapped float32 matrix never has to be fully in RAM.
+    if method not in QUANTIZATIONS:
+        raise ValueError(f"unknown quantization: {method}")
+    n, dim = embeddings.shape
+    if method == "float32":
+        return embeddings, None
+
+    scale = None
+    if method == "int8":
+        max_abs = np.zeros(dim, dtype=np.float32)
+        for start in range(0, n, chunk_size):
+            chunk = np.abs(np.asarray(embeddings[start:start + chunk_size], dtype=np.float32))
+            np.maximum(max_abs, chunk.max(axis=0), out=max_abs)
+        scale = np.maximum(max_abs, 1e-12) / 127.0
+        codes = np.empty((n, dim), dtype=np.int8)
+    elif method == "float16":
+        codes = np.empty((n, dim), dtype=np.float16)
+    else:
+        codes = np.empty((n, -(-dim // 64) * 8), dtype=np.uint8)
+
+    for start in range(0, n, chunk_size):
+        chunk = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        rows = slice(start, start + len(chunk))
+        if method == "int8":
+            codes[rows] = np.clip(np.rint(chunk / scale), -127, 127)
+        elif method == "float16":
+            codes[rows] = chunk
+        else:
+            codes[rows] = pack_bits(chunk)
+    return codes, scale
+
+
+def pack_bits(vectors):
+    # Rows are zero-padded to whole 64-bit words so hamming_distances can
+    # XOR / popcount 8 bytes at a time
+    bits = np.packbits(np.asarray(vectors) > 0, axis=-1)
+    pad = -bits.shape[-1] % 8
+    if pad:
+        bits = np.pad(bits, [(0, 0)] * (bits.ndim - 1) + [(0, pad)])
+    return bits
+
+
+def scores(query_embs, codes, method, scale=None, chunk_size=16384):
+    # Approximate inner products [queries, rows] for float / int8 codes. Codes
+    # are widened to float32 `chunk_size` rows at a time, never all at once.
+    if method == "binary":
+        raise ValueError("binary codes are searched with hamming_distances + rescoring")
+    query_embs = np.asarray(query_embs, dtype=np.float32)
+    if method == "int8":
+        query_embs = query_embs * scale
+    if codes.dtype == np.float32:
+        return query_embs @ codes.T
+    out = np.empty((len(query_embs), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), chunk_size):
+        chunk = codes[start:start + chunk_size].astype(np.float32)
+        out[:, start:start + len(chunk)] = query_embs @ chunk.T
+    return out
+
+
+def hamming_distances(query_bits, codes):
+    # [queries, bytes] x [rows, bytes] -> [queries, rows] differing bits
+    if query_bits.shape[1] % 8 == 0:
+        query_bits = np.ascontiguousarray(query_bits).view(np.uint64)
+        codes = np.ascontiguousarray(codes).view(np.uint64)
+    xor = np.bitwise_xor(query_bits[:, None, :], codes[None, :, :])
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor).sum(axis=2, dtype=np.int32)
+    return _POPCOUNT[xor.view(np.uint8)].sum(axis=2, dtype=np.int32)
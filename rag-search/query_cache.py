@@ -0,0 +1,163 @@
+import functools
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+# -----------------------------
+# In-process caches for repeated queries
+# -----------------------------
+# QueryEmbeddingCache: query embeddings keyed by model name + normalized query
+#   text, LRU with TTL; evicted entries optionally spill to .npy files on disk.
+# ResultCache: top-k result lists keyed by mode + normalized arguments + the
+#   corpus version; bump_version() after an index refresh makes every older
+#   entry unreachable.
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text):
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+class LRUCache:
+    def __init__(self, maxsize=10000, ttl=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (item[0] is not None and item[0] < time.monotonic()):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False))
+        if self.on_evict is not None:
+            for old_key, (expires_at, old_value) in evicted:
+                self.on_evict(old_key, old_value, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, model_name, maxsize=10000, ttl=3600, spill_dir=None):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self._memory = LRUCache(maxsize, ttl, on_evict=self._spill if spill_dir else None)
+
+    def _key(self, text):
+        return self.model_name, normalize_query(text)
+
+    def _spill_file(self, key):
+        digest = hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, digest + ".npy")
+
+    def _spill(self, key, value, expires_at):
+        if expires_at is not None and expires_at < time.monotonic():
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        tmp = self._spill_file(key) + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, value, allow_pickle=False)
+        os.replace(tmp, self._spill_file(key))
+
+    def _load_spilled(self, key):
+        path = self._spill_file(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, text):
+        key = self._key(text)
+        value = self._memory.get(key)
+        if value is None and self.spill_dir:
+            value = self._load_spilled(key)
+            if value is not None:
+                self._memory.put(key, value)
+        return value
+
+    def put(self, text, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        self._memory.put(self._key(text), embedding)
+
+    def encode(self, encoder, texts, batch_size=64):
+        # Same contract as encoder.encode(..., normalize_embeddings=True) for
+        # a str or a list of str; only cache misses reach the encoder
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        cached = [self.get(t) for t in texts]
+        missing = [i for i, v in enumerate(cached) if v is None]
+        if missing:
+            # Identical texts in one batch are encoded once
+            unique = list(dict.fromkeys(normalize_query(texts[i]) for i in missing))
+            vectors = encoder.encode(unique, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+            by_text = dict(zip(unique, vectors))
+            for i in missing:
+                cached[i] = by_text[normalize_query(texts[i])]
+                self.put(texts[i], cached[i])
+        if single:
+            return cached[0]
+        return np.stack(cached) if cached else np.zeros((0, 0), dtype=np.float32)
+
+
+class ResultCache:
+    def __init__(self, maxsize=10000, ttl=300):
+        self._memory = LRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def bump_version(self):
+        # Call whenever the corpus or an index changed
+        with self._lock:
+            self.version += 1
+        self._memory.clear()
+        return self.version
+
+    def cached(self, mode):
+        # Decorator for search functions whose first argument is the query text
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(query_text, *args, **kwargs):
+                key = (mode, self.version, normalize_query(query_text), args, tuple(sorted(kwargs.items())))
+                result = self._memory.get(key)
+                if result is None:
+                    result = fn(query_text, *args, **kwargs)
+                    self._memory.put(key, tuple(result))
+                return list(result)
+            return wrapper
+        return decorator
@@ -1,14 +1,33 @@
+import argparse
+import os
+import threading
+
 import psycopg2
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from datetime import datetime
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer, util
-import openai
+
+from db_pool import ConnectionPool, AsyncConnectionPool
+from encoder import Encoder
+from query_cache import QueryEmbeddingCache, ResultCache
+from embedding_worker import EmbeddingWorker
+from embedding_store import EmbeddingStore
+from vector_shards import VectorShards
+from tfidf_index import TfidfIndex
+from bm25_index import BM25Index
+import pgvector_index
+import fulltext_index
+import hybrid
+from streaming_search import stream_search
+import ltr
+from cross_encoder import CrossEncoderReranker
 
 # -----------------------------
 # CONFIGURATION
 # -----------------------------
+# On-disk indexes live next to this script, whatever the working directory
+HERE = os.path.dirname(os.path.abspath(__file__))
+
 DB_CONFIG = {
     "dbname": "ai_memory",
     "user": "admin",
@@ -17,163 +36,631 @@ DB_CONFIG = {
     "port": 5434
 }
 
+# Number of results returned by the ranked search modes (see topk.py)
+DEFAULT_K = 5
+
+# Rows per server-side cursor fetch in the streaming search mode
+STREAMING_CHUNK_SIZE = 1000
+
+# Shared by every search mode (see db_pool.py)
+POOL_CONFIG = {
+    "minconn": 1,
+    "maxconn": 10,
+    "health_check_interval": 30.0,
+    "acquire_timeout": 10.0,
+}
+
+
+
+# Sentence-transformers model for neural search. Loaded lazily on the first
+# semantic call (or warm_up()), so keyword-only runs never import torch.
+# backend="onnx" runs the same model on ONNX Runtime; point onnx_file_name at
+# an int8 graph (e.g. "onnx/model_qint8_avx512_vnni.onnx") for fast CPU-only
+# inference. See encoder.py.
+MODEL_NAME = 'all-MiniLM-L6-v2'
+ENCODER_CONFIG = {
+    "backend": "torch",
+    "onnx_file_name": None,
+}
+model = Encoder(MODEL_NAME, **ENCODER_CONFIG)
+
+# Query embedding LRU (optionally spilling evicted entries to spill_dir) and
+# top-k result LRU invalidated by refreshing any index (see query_cache.py)
+QUERY_CACHE_CONFIG = {
+    "maxsize": 10000,
+    "ttl": 3600,
+    "spill_dir": None,
+}
+RESULT_CACHE_CONFIG = {
+    "maxsize": 10000,
+    "ttl": 300,
+}
+query_embeddings = QueryEmbeddingCache(MODEL_NAME, **QUERY_CACHE_CONFIG)
+result_cache = ResultCache(**RESULT_CACHE_CONFIG)
+
+# Single-query encodes from concurrent callers (threads or the service) are
+# collected for up to max_wait_ms / max_batch texts and encoded as one batch
+# (see embedding_worker.py). Cache hits never wait.
+EMBEDDING_WORKER_CONFIG = {
+    "max_batch": 32,
+    "max_wait_ms": 5.0,
+}
+
+# Directory holding the precomputed corpus embeddings (see embedding_store.py)
+EMBEDDING_STORE_PATH = os.path.join(HERE, "embedding_store")
+
+# In-memory representation of the store: "float32", "float16", "int8" or
+# "binary" (Hamming pre-filter, float32 rescoring of rescore_factor * k rows).
+# See quantization.py for the memory / recall trade-off.
+EMBEDDING_STORE_CONFIG = {
+    "quantization": "float32",
+    "rescore_factor": 10,
+}
+
+# Per-(tenant, lang) in-memory slices of the store used by tenant-scoped
+# neural search, least recently used evicted first (see vector_shards.py)
+VECTOR_SHARD_CONFIG = {
+    "max_shards": 64,
+}
 
+# Directory holding the fitted TF-IDF index over te_ai_message (see tfidf_index.py)
+TFIDF_INDEX_PATH = os.path.join(HERE, "tfidf_index")
 
-# Sentence-transformers model for neural search
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Directory holding the BM25F inverted index over te_ai_message (see bm25_index.py)
+BM25_INDEX_PATH = os.path.join(HERE, "bm25_index")
+
+# Optional cross-encoder rerank of the first-stage top_n hits of any mode
+# (see cross_encoder.py); time_budget is in seconds per query
+RERANK_CONFIG = {
+    "model_name": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+    "top_n": 50,
+    "batch_size": 16,
+    "time_budget": 0.25,
+}
+
+# Reranker for ltr_search: LinearRanker .json or pickled model (see ltr.py);
+# falls back to built-in linear weights when the file does not exist
+LTR_MODEL_PATH = os.path.join(HERE, "ltr_model.json")
+
+# pgvector ANN index on te_ai_canonical_data.embedding (see pgvector_index.py).
+# ef_search (HNSW) / probes (IVFFlat) are the default recall-vs-latency knobs
+# and can be overridden per query in vector_search().
+VECTOR_INDEX_CONFIG = {
+    "method": "hnsw",
+    "metric": "cosine",
+    "m": 16,
+    "ef_construction": 64,
+}
+VECTOR_SEARCH_CONFIG = {
+    "ef_search": 40,
+    "probes": 10,
+}
 
 
 # -----------------------------
 # DATABASE CONNECTION
 # -----------------------------
 def get_connection():
+    # Dedicated connection outside the pool, e.g. for long maintenance jobs
     conn = psycopg2.connect(**DB_CONFIG)
     return conn
 
 
+_pool = None
+_async_pool = None
+_query_executor = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+    return _pool
+
+
+def db_connection():
+    return get_pool().connection()
+
+
+def get_query_executor():
+    # Runs independent DB-bound queries concurrently, one pooled connection each.
+    # Kept separate from hybrid's executor, whose tasks are submitted from here.
+    global _query_executor
+    if _query_executor is None:
+        _query_executor = ThreadPoolExecutor(max_workers=POOL_CONFIG["maxconn"], thread_name_prefix="search")
+    return _query_executor
+
+
+def get_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = AsyncConnectionPool(DB_CONFIG, **POOL_CONFIG)
+    return _async_pool
+
+
+def warm_up(semantic=True, indexes=True):
+    # Explicit start-up hook: load the model and the in-process indexes now
+    # instead of on the first query
+    if semantic:
+        model.warm_up()
+    if indexes:
+        get_embedding_store()
+        get_tfidf_index()
+        get_bm25_index()
+
+
+def encode_query(query_text):
+    query_emb = query_embeddings.get(query_text)
+    if query_emb is None:
+        query_emb = embedding_worker.encode(query_text)
+    return query_emb
+
+
+def encode_queries(query_texts, batch_size=64):
+    return query_embeddings.encode(model, list(query_texts), batch_size=batch_size)
+
+
+embedding_worker = EmbeddingWorker(
+    encode_queries,
+    max_batch=EMBEDDING_WORKER_CONFIG["max_batch"],
+    max_wait=EMBEDDING_WORKER_CONFIG["max_wait_ms"] / 1000.0,
+)
+
+
+def encode_corpus(texts, batch_size=64):
+    # Document texts bypass the query cache
+    return model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+
+
+# -----------------------------
+# EMBEDDING STORE
+# -----------------------------
+_embedding_store = None
+_embedding_store_lock = threading.Lock()
+
+
+def get_embedding_store():
+    global _embedding_store
+    if _embedding_store is None:
+        with _embedding_store_lock:
+            if _embedding_store is None:
+                store = EmbeddingStore(EMBEDDING_STORE_PATH, MODEL_NAME, **EMBEDDING_STORE_CONFIG)
+                if not store.load():
+                    with db_connection() as conn:
+                        store.sync(conn, model)
+                _embedding_store = store
+    return _embedding_store
+
+
+def refresh_embedding_store():
+    # Re-encodes only new/changed canonical rows; call after ingesting data.
+    # The sync runs on a fresh store that is swapped in with one assignment,
+    # so a concurrent search sees either the old or the new store, never
+    # new ids next to old codes.
+    global _embedding_store, _vector_shards
+    with _embedding_store_lock:
+        old = _embedding_store
+        store = EmbeddingStore(EMBEDDING_STORE_PATH, MODEL_NAME, **EMBEDDING_STORE_CONFIG)
+        store.load()
+        with db_connection() as conn:
+            changed = store.sync(conn, model)
+        _embedding_store = store
+        # Shards are copies of the old store
+        _vector_shards = None
+    # Deleted rows or new lang / tenant values change results without any
+    # row being re-encoded
+    if changed or old is None or not all(
+        _same_array(getattr(old, name), getattr(store, name)) for name in ("ids", "langs", "tenants")
+    ):
+        result_cache.bump_version()
+    return changed
+
+
+def _same_array(a, b):
+    if a is None or b is None:
+        return a is b
+    return np.array_equal(a, b)
+
+
+_vector_shards = None
+
+
+def get_vector_shards():
+    global _vector_shards
+    store = get_embedding_store()
+    shards = _vector_shards
+    if shards is None or shards.store is not store:
+        shards = _vector_shards = VectorShards(store, **VECTOR_SHARD_CONFIG)
+    return shards
+
+
+def fetch_canonical_content(hits):
+    return fetch_canonical_content_many([hits])[0]
+
+
+def fetch_canonical_content_many(hit_lists):
+    # One round trip for the hits of every query
+    ids = list({cantxt_id for hits in hit_lists for cantxt_id, _ in hits})
+    if not ids:
+        return [[] for _ in hit_lists]
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT cantxt_id, cantxt_content_text FROM te_ai_canonical_data WHERE cantxt_id = ANY(%s)",
+            (ids,),
+        )
+        content = dict(cur.fetchall())
+    return [
+        [(cantxt_id, content[cantxt_id], score) for cantxt_id, score in hits if cantxt_id in content]
+        for hits in hit_lists
+    ]
+
+
+# -----------------------------
+# TF-IDF INDEX
+# -----------------------------
+_tfidf_index = None
+_tfidf_lock = threading.Lock()
+
+
+def get_tfidf_index():
+    global _tfidf_index
+    if _tfidf_index is None:
+        with _tfidf_lock:
+            if _tfidf_index is None:
+                index = TfidfIndex(TFIDF_INDEX_PATH)
+                if not index.load():
+                    with db_connection() as conn:
+                        index.refresh(conn)
+                _tfidf_index = index
+    return _tfidf_index
+
+
+def refresh_tfidf_index():
+    # Appends new msg_ids with the fitted vocabulary; refits when it drifts too
+    # far. Works on a fresh copy that is swapped in whole, so a concurrent
+    # search never scores matrix rows that have no id yet.
+    global _tfidf_index
+    with _tfidf_lock:
+        index = TfidfIndex(TFIDF_INDEX_PATH)
+        index.load()
+        with db_connection() as conn:
+            changed = index.refresh(conn)
+        _tfidf_index = index
+    if changed:
+        result_cache.bump_version()
+    return changed
+
+
+# -----------------------------
+# BM25 INDEX
+# -----------------------------
+_bm25_index = None
+_bm25_lock = threading.Lock()
+
+
+def get_bm25_index():
+    global _bm25_index
+    if _bm25_index is None:
+        with _bm25_lock:
+            if _bm25_index is None:
+                index = BM25Index(BM25_INDEX_PATH)
+                if not index.load():
+                    with db_connection() as conn:
+                        index.build(conn)
+                _bm25_index = index
+    return _bm25_index
+
+
+def rebuild_bm25_index():
+    # Builds into a new BM25Index and swaps it in whole: vocab, postings and
+    # upper bounds of the old and new index never mix in a concurrent search
+    global _bm25_index
+    with _bm25_lock:
+        index = BM25Index(BM25_INDEX_PATH)
+        with db_connection() as conn:
+            count = index.build(conn)
+        _bm25_index = index
+    result_cache.bump_version()
+    return count
+
+
+def fetch_message_content(hits):
+    return fetch_message_content_many([hits])[0]
+
+
+def fetch_message_content_many(hit_lists):
+    ids = list({msg_id for hits in hit_lists for msg_id, _ in hits})
+    if not ids:
+        return [[] for _ in hit_lists]
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT msg_id, msg_content_text FROM te_ai_message WHERE msg_id = ANY(%s)",
+            (ids,),
+        )
+        content = dict(cur.fetchall())
+    return [[(content[msg_id], score) for msg_id, score in hits if msg_id in content] for hits in hit_lists]
+
+
 # -----------------------------
 # 1️⃣ Keyword-based search
 # -----------------------------
-def keyword_search(keyword):
-    conn = get_connection()
-    cur = conn.cursor()
-    query = "SELECT msg_id, msg_content_text FROM te_ai_message WHERE msg_content_text ILIKE %s"
-    cur.execute(query, (f"%{keyword}%",))
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
-    return results
+def keyword_search(keyword, limit=None):
+    with db_connection() as conn:
+        return fulltext_index.search_messages(conn, keyword, limit)
+
+
+async def keyword_search_async(keyword, limit=None):
+    pool = get_async_pool()
+    for sql, params in (fulltext_index.message_fulltext_query(keyword, limit),
+                        fulltext_index.message_substring_query(keyword, limit)):
+        rows = await pool.fetch_pg(sql, params)
+        if rows:
+            return [tuple(r) for r in rows]
+    return []
 
 
 # -----------------------------
 # 2️⃣ TF-IDF / BM25 search
 # -----------------------------
-def tfidf_search(query_text):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT msg_content_text FROM te_ai_message")
-    docs = [r[0] for r in cur.fetchall()]
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(docs)
-    query_vec = vectorizer.transform([query_text])
-    scores = cosine_similarity(query_vec, tfidf_matrix)[0]
-    ranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
-    cur.close()
-    conn.close()
-    return ranked[:5]
+@result_cache.cached("tfidf")
+def tfidf_search(query_text, k=DEFAULT_K):
+    index = get_tfidf_index()
+    return fetch_message_content(index.search(query_text, k=k))
+
+
+@result_cache.cached("bm25")
+def bm25_search(query_text, k=DEFAULT_K):
+    index = get_bm25_index()
+    return fetch_message_content(index.search(query_text, k=k))
 
 
 # -----------------------------
 # 3️⃣ Semantic search (OpenAI embeddings)
 # -----------------------------
-def semantic_search(query_text):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT cantxt_id, cantxt_content_text FROM te_ai_canonical_data")
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    docs = [r[1] for r in results]
-    embeddings = model.encode(docs, convert_to_tensor=True)
-    query_emb = model.encode(query_text, convert_to_tensor=True)
-    scores = util.cos_sim(query_emb, embeddings)[0]
-    ranked = sorted(zip(results, scores), key=lambda x: x[1], reverse=True)
-    return [(r[0], r[1], float(score)) for r, score in ranked[:5]]
+@result_cache.cached("semantic")
+def semantic_search(query_text, k=DEFAULT_K, tenant_id=None, lang=None):
+    store = get_vector_shards().get(tenant_id, lang)
+    query_emb = encode_query(query_text)
+    return fetch_canonical_content(store.search(query_emb, k=k))
 
 
 # -----------------------------
 # 4️⃣ Vector / ANN search (pgvector)
 # -----------------------------
-def vector_search(query_embedding):
+def vector_search_knobs(ef_search=None, probes=None):
+    knobs = dict(VECTOR_SEARCH_CONFIG)
+    if ef_search is not None:
+        knobs["ef_search"] = ef_search
+    if probes is not None:
+        knobs["probes"] = probes
+    if VECTOR_INDEX_CONFIG["method"] == "hnsw":
+        knobs.pop("probes")
+    else:
+        knobs.pop("ef_search")
+    return knobs
+
+
+def vector_search(query_embedding, k=DEFAULT_K, ef_search=None, probes=None):
+    knobs = vector_search_knobs(ef_search, probes)
+    with db_connection() as conn:
+        rows = pgvector_index.ann_search(
+            conn, query_embedding, k=k, metric=VECTOR_INDEX_CONFIG["metric"], **knobs
+        )
+    return [(r[0], r[1]) for r in rows]
+
+
+def setup_fulltext_indexes():
+    # Migration (`search-script.py --setup`): tsvector columns + GIN indexes,
+    # pg_trgm indexes for substrings. keyword / domain / hybrid search need it.
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT cantxt_id, cantxt_content_text FROM te_ai_canonical_data ORDER BY embedding <-> %s LIMIT 5;", (query_embedding,))
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
-    return results
+    try:
+        fulltext_index.create_fulltext_indexes(conn)
+    finally:
+        conn.close()
+
+
+def setup_vector_index(backfill=True):
+    # One-off / periodic maintenance: vector column, missing embeddings, ANN index
+    conn = get_connection()
+    try:
+        pgvector_index.ensure_vector_column(conn, model.get_sentence_embedding_dimension())
+        filled = pgvector_index.backfill_embeddings(conn, model) if backfill else 0
+        pgvector_index.create_index(conn, **VECTOR_INDEX_CONFIG)
+    finally:
+        conn.close()
+    return filled
 
 
 # -----------------------------
-# 5️⃣ Learning-to-rank (TF-IDF + ML features)
+# 5️⃣ Learning-to-rank (candidates + feature reranker)
 # -----------------------------
-def ltr_search(query_text):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT msg_content_text FROM te_ai_message")
-    docs = [r[0] for r in cur.fetchall()]
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(docs)
-    query_vec = vectorizer.transform([query_text])
-    scores = cosine_similarity(query_vec, tfidf_matrix)[0]
-    ranked = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
-    cur.close()
-    conn.close()
-    return ranked[:5]
+_ranker = None
+
+
+def get_ranker():
+    global _ranker
+    if _ranker is None:
+        _ranker = ltr.load_ranker(LTR_MODEL_PATH)
+    return _ranker
+
+
+@result_cache.cached("ltr")
+def ltr_search(query_text, k=DEFAULT_K, lang="en", candidates=200):
+    # Stage 1: BM25 over messages + embedding store over canonical rows
+    store = get_embedding_store()
+    query_emb = encode_query(query_text)
+    emb_hits = store.search(query_emb, k=candidates)
+    bm25_hits = get_bm25_index().search(query_text, k=candidates)
+
+    # Stage 2: feature matrix over the union, scored by the ranker
+    with db_connection() as conn:
+        rows = ltr.fetch_candidates(conn, [i for i, _ in emb_hits], [i for i, _ in bm25_hits])
+    doc_embeddings, found = store.vectors_for([r[0] for r in rows])
+    if not found.all():
+        missing = np.flatnonzero(~found)
+        doc_embeddings[missing] = encode_corpus([rows[i][1] or "" for i in missing])
+    X = ltr.feature_matrix(
+        query_text, query_emb, rows, doc_embeddings,
+        vectorizer=get_tfidf_index().vectorizer, bm25_scores=dict(bm25_hits), lang=lang,
+    )
+    return ltr.rerank(get_ranker(), rows, X, k=k)
 
 
 # -----------------------------
 # 6️⃣ Neural search (SentenceTransformer)
 # -----------------------------
-def neural_search(query_text):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT cantxt_id, cantxt_content_text FROM te_ai_canonical_data")
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
+@result_cache.cached("neural")
+def neural_search(query_text, k=DEFAULT_K, tenant_id=None, lang=None):
+    # tenant_id / lang restrict the scan to that shard of the store (None: all)
+    store = get_vector_shards().get(tenant_id, lang)
+    query_emb = encode_query(query_text)
+    return fetch_canonical_content(store.search(query_emb, k=k))
+
 
-    docs = [r[1] for r in results]
-    embeddings = model.encode(docs, convert_to_tensor=True)
-    query_emb = model.encode(query_text, convert_to_tensor=True)
-    scores = util.cos_sim(query_emb, embeddings)[0]
-    ranked = sorted(zip(results, scores), key=lambda x: x[1], reverse=True)
-    return [(r[0], r[1], float(score)) for r, score in ranked[:5]]
+def neural_search_streaming(query_text, k=DEFAULT_K, lang=None, tenant_id=None):
+    # Bounded-memory variant that does not need the embedding store
+    where, params = hybrid.build_filters(lang, tenant_id)
+    query_emb = encode_query(query_text)
+    with db_connection() as conn:
+        return stream_search(
+            conn, encode_corpus, query_emb, k=k, chunk_size=STREAMING_CHUNK_SIZE,
+            where=where or None, params=params,
+        )
 
 
 # -----------------------------
 # 7️⃣ Domain-specific search (example: language filter)
 # -----------------------------
-def domain_search(keyword, lang="en"):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT cantxt_content_text 
-        FROM te_ai_canonical_data 
-        WHERE cantxt_content_text ILIKE %s AND cantxt_lang=%s
-    """, (f"%{keyword}%", lang))
-    results = [r[0] for r in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return results
+def domain_search(keyword, lang="en", limit=None):
+    with db_connection() as conn:
+        return fulltext_index.search_canonical(conn, keyword, lang, limit)
+
+
+async def domain_search_async(keyword, lang="en", limit=None):
+    pool = get_async_pool()
+    for sql, params in (fulltext_index.canonical_fulltext_query(keyword, lang, limit),
+                        fulltext_index.canonical_substring_query(keyword, lang, limit)):
+        rows = await pool.fetch_pg(sql, params)
+        if rows:
+            return [r[0] for r in rows]
+    return []
 
 
 # -----------------------------
-# 8️⃣ Hybrid search (vector + keyword filter)
+# 8️⃣ Hybrid search (keyword + vector, rank fusion)
 # -----------------------------
-def hybrid_search(query_text, lang="en"):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT cantxt_id, cantxt_content_text FROM te_ai_canonical_data WHERE cantxt_lang=%s", (lang,))
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
+def hybrid_search(query_text, lang="en", tenant_id=None, k=DEFAULT_K, fusion="rrf"):
+    query_emb = encode_query(query_text)
+    return hybrid.hybrid_retrieve(
+        get_pool(), query_text, query_emb, k=k, lang=lang, tenant_id=tenant_id, fusion=fusion,
+        metric=VECTOR_INDEX_CONFIG["metric"], **vector_search_knobs(),
+    )
+
+
+# -----------------------------
+# CROSS-ENCODER RERANKER
+# -----------------------------
+_reranker = None
 
-    docs = [r[1] for r in results]
-    embeddings = model.encode(docs, convert_to_tensor=True)
-    query_emb = model.encode(query_text, convert_to_tensor=True)
-    scores = util.cos_sim(query_emb, embeddings)[0]
-    ranked = sorted(zip(results, scores), key=lambda x: x[1], reverse=True)
-    return [(r[0], r[1], float(score)) for r, score in ranked[:5]]
+
+def get_reranker():
+    global _reranker
+    if _reranker is None:
+        _reranker = CrossEncoderReranker(**RERANK_CONFIG)
+    return _reranker
+
+
+# -----------------------------
+# 9️⃣ Batched multi-query search
+# -----------------------------
+def search(query_text, mode="neural", k=DEFAULT_K, lang="en", tenant_id=None, rerank=False, **options):
+    return search_many([query_text], mode=mode, k=k, lang=lang, tenant_id=tenant_id, rerank=rerank, **options)[0]
+
+
+def search_many(queries, mode="neural", k=DEFAULT_K, lang="en", tenant_id=None, rerank=False,
+                fusion="rrf", ef_search=None, probes=None):
+    # Returns one result list per query, in the same shape as the single-query mode.
+    # fusion applies to "hybrid", ef_search / probes to "vector" and "hybrid".
+    queries = list(queries)
+    if not queries:
+        return []
+    if rerank:
+        # Retrieve a deeper first stage, let the cross-encoder reorder it
+        reranker = get_reranker()
+        first_stage = search_many(queries, mode=mode, k=max(k, reranker.top_n), lang=lang, tenant_id=tenant_id,
+                                  fusion=fusion, ef_search=ef_search, probes=probes)
+        return [reranker.rerank(q, hits, k=k) for q, hits in zip(queries, first_stage)]
+
+    if mode in ("neural", "semantic"):
+        # Same shard as neural_search: only that tenant's / language's rows
+        store = get_vector_shards().get(tenant_id, lang)
+        return fetch_canonical_content_many(store.search_many(encode_queries(queries), k=k))
+
+    if mode == "streaming":
+        where, params = hybrid.build_filters(lang, tenant_id)
+        with db_connection() as conn:
+            return stream_search(
+                conn, encode_corpus, encode_queries(queries), k=k, chunk_size=STREAMING_CHUNK_SIZE,
+                where=where or None, params=params,
+            )
+
+    if mode == "tfidf":
+        return fetch_message_content_many(get_tfidf_index().search_many(queries, k=k))
+
+    if mode == "ltr":
+        return [ltr_search(q, k=k, lang=lang) for q in queries]
+
+    if mode == "bm25":
+        index = get_bm25_index()
+        return fetch_message_content_many([index.search(q, k=k) for q in queries])
+
+    # Modes answered by Postgres: one pooled connection per in-flight query
+    if mode == "vector":
+        embeddings = encode_queries(queries)
+        return list(get_query_executor().map(
+            lambda emb: vector_search(emb, k=k, ef_search=ef_search, probes=probes), embeddings
+        ))
+
+    if mode == "hybrid":
+        embeddings = encode_queries(queries)
+        knobs = vector_search_knobs(ef_search, probes)
+        return list(get_query_executor().map(
+            lambda args: hybrid.hybrid_retrieve(
+                get_pool(), args[0], args[1], k=k, lang=lang, tenant_id=tenant_id, fusion=fusion,
+                metric=VECTOR_INDEX_CONFIG["metric"], **knobs,
+            ),
+            zip(queries, embeddings),
+        ))
+
+    if mode == "keyword":
+        return list(get_query_executor().map(lambda q: keyword_search(q, limit=k), queries))
+
+    if mode == "domain":
+        return list(get_query_executor().map(lambda q: domain_search(q, lang=lang, limit=k), queries))
+
+    raise ValueError(f"unknown search mode: {mode}")
 
 
 # -----------------------------
 # Example usage
 # -----------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Example queries against every search mode")
+    parser.add_argument("--setup", action="store_true",
+                        help="run the full-text and vector index migrations and exit")
+    parser.add_argument("--no-backfill", action="store_true",
+                        help="with --setup: create the vector index without encoding missing rows")
+    args = parser.parse_args()
+    if args.setup:
+        setup_fulltext_indexes()
+        filled = setup_vector_index(backfill=not args.no_backfill)
+        print(f"Full-text and vector indexes ready, {filled} embeddings backfilled")
+        raise SystemExit(0)
+
     print("Keyword search:", keyword_search("tooth pain"))
     print("TF-IDF search:", tfidf_search("tooth pain"))
+    print("BM25 search:", bm25_search("tooth pain"))
     print("Neural search:", neural_search("tooth pain"))
     print("Domain search (English):", domain_search("tooth pain"))
     print("Hybrid search:", hybrid_search("tooth pain"))
+    print("Batched neural search:", search_many(["tooth pain", "root canal", "x-ray"], mode="neural"))
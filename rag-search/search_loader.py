@@ -0,0 +1,14 @@
+import importlib.util
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_search_module():
+    # search-script.py is not importable by name because of the dash
+    spec = importlib.util.spec_from_file_location("search_script", os.path.join(HERE, "search-script.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, HERE)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,177 @@
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from search_loader import load_search_module
+
+
+# -----------------------------
+# Long-running HTTP service for the rag-search modes
+# -----------------------------
+#   uvicorn service:app --host 0.0.0.0 --port 8000      (from rag-search/)
+#
+# The encoder, in-process indexes and both connection pools are loaded once
+# at startup and stay resident. Blocking work (encoding, index scoring,
+# psycopg2 queries) runs on thread pools so the event loop only schedules;
+# keyword / domain search go straight through the asyncpg pool.
+#
+# Query encodes of concurrent requests are micro-batched by the shared
+# embedding worker (EMBEDDING_WORKER_CONFIG in search-script.py), which also
+# fills the query embedding cache the search functions read from.
+
+SERVICE_CONFIG = {
+    "search_workers": 16,
+    "warm_up": True,
+}
+
+# Modes that encode the query text before searching
+EMBEDDING_MODES = ("neural", "semantic", "vector", "hybrid", "ltr", "streaming")
+
+
+search = load_search_module()
+
+
+class SearchRequest(BaseModel):
+    query: str
+    k: int = search.DEFAULT_K
+    lang: Optional[str] = "en"
+    tenant_id: Optional[str] = None
+    rerank: bool = False
+
+
+class HybridRequest(SearchRequest):
+    fusion: str = "rrf"
+
+
+class VectorRequest(SearchRequest):
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+
+
+class SearchResponse(BaseModel):
+    mode: str
+    query: str
+    results: List[Any]
+
+
+_state = {}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    loop = asyncio.get_running_loop()
+    search_executor = ThreadPoolExecutor(max_workers=SERVICE_CONFIG["search_workers"], thread_name_prefix="service")
+    _state["executor"] = search_executor
+    if SERVICE_CONFIG["warm_up"]:
+        await loop.run_in_executor(search_executor, search.warm_up)
+    await search.get_async_pool().open()
+    try:
+        yield
+    finally:
+        await search.get_async_pool().close()
+        search.get_pool().close()
+        search.embedding_worker.close()
+        search_executor.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_state["executor"], partial(fn, *args, **kwargs))
+
+
+def rerank_options(req):
+    # Mode-specific knobs of the request, forwarded to the reranked first stage
+    return {name: getattr(req, name) for name in ("fusion", "ef_search", "probes") if hasattr(req, name)}
+
+
+async def run_mode(mode, req, fn, *args, **kwargs):
+    try:
+        if mode in EMBEDDING_MODES and search.query_embeddings.get(req.query) is None:
+            # Wait for the batched encode here rather than on a search thread;
+            # fn's own encode_query is then a cache hit
+            await asyncio.wrap_future(search.embedding_worker.submit(req.query))
+        if req.rerank:
+            results = await run_blocking(
+                search.search, req.query, mode=mode, k=req.k, lang=req.lang, tenant_id=req.tenant_id, rerank=True,
+                **rerank_options(req),
+            )
+        elif inspect.iscoroutinefunction(fn):
+            results = await fn(*args, **kwargs)
+        else:
+            results = await run_blocking(fn, *args, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SearchResponse(mode=mode, query=req.query, results=results)
+
+
+def _vector_search(query_text, **kwargs):
+    return search.vector_search(search.encode_query(query_text), **kwargs)
+
+
+@app.post("/search/keyword", response_model=SearchResponse)
+async def keyword(req: SearchRequest):
+    return await run_mode("keyword", req, search.keyword_search_async, req.query, limit=req.k)
+
+
+@app.post("/search/domain", response_model=SearchResponse)
+async def domain(req: SearchRequest):
+    return await run_mode("domain", req, search.domain_search_async, req.query, lang=req.lang, limit=req.k)
+
+
+@app.post("/search/tfidf", response_model=SearchResponse)
+async def tfidf(req: SearchRequest):
+    return await run_mode("tfidf", req, search.tfidf_search, req.query, k=req.k)
+
+
+@app.post("/search/bm25", response_model=SearchResponse)
+async def bm25(req: SearchRequest):
+    return await run_mode("bm25", req, search.bm25_search, req.query, k=req.k)
+
+
+@app.post("/search/semantic", response_model=SearchResponse)
+async def semantic(req: SearchRequest):
+    return await run_mode("semantic", req, search.semantic_search, req.query, k=req.k, tenant_id=req.tenant_id,
+                          lang=req.lang)
+
+
+@app.post("/search/neural", response_model=SearchResponse)
+async def neural(req: SearchRequest):
+    return await run_mode("neural", req, search.neural_search, req.query, k=req.k, tenant_id=req.tenant_id,
+                          lang=req.lang)
+
+
+@app.post("/search/streaming", response_model=SearchResponse)
+async def streaming(req: SearchRequest):
+    return await run_mode("streaming", req, search.neural_search_streaming, req.query, k=req.k,
+                          lang=req.lang, tenant_id=req.tenant_id)
+
+
+@app.post("/search/vector", response_model=SearchResponse)
+async def vector(req: VectorRequest):
+    return await run_mode("vector", req, _vector_search, req.query, k=req.k, ef_search=req.ef_search,
+                          probes=req.probes)
+
+
+@app.post("/search/hybrid", response_model=SearchResponse)
+async def hybrid(req: HybridRequest):
+    return await run_mode("hybrid", req, search.hybrid_search, req.query, lang=req.lang,
+                          tenant_id=req.tenant_id, k=req.k, fusion=req.fusion)
+
+
+@app.post("/search/ltr", response_model=SearchResponse)
+async def ltr(req: SearchRequest):
+    return await run_mode("ltr", req, search.ltr_search, req.query, k=req.k, lang=req.lang or "en")
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok", "model_loaded": search.model.loaded}
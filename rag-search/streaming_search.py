@@ -0,0 +1,47 @@
+import uuid
+
+import numpy as np
+
+from topk import StreamingTopK
+
+
+# -----------------------------
+# Streaming (bounded-memory) semantic search over te_ai_canonical_data
+# -----------------------------
+# Rows are read through a server-side (named) cursor `chunk_size` at a time;
+# each chunk is encoded, scored against every query and folded into a running
+# top-k heap per query, then dropped. Memory is O(chunk_size + k) no matter
+# how large the table grows, at the cost of encoding the corpus per call;
+# use it when the precomputed embedding store does not fit or is not built.
+
+
+def stream_search(conn, encode, query_embs, k=5, chunk_size=1000, where=None, params=()):
+    # encode(list_of_texts) -> [n, dim] L2-normalized float32 array
+    query_embs = np.asarray(query_embs, dtype=np.float32)
+    single = query_embs.ndim == 1
+    query_embs = np.atleast_2d(query_embs)
+    query_embs = query_embs / np.maximum(np.linalg.norm(query_embs, axis=1, keepdims=True), 1e-12)
+
+    heaps = [StreamingTopK(k) for _ in range(len(query_embs))]
+    where_sql = f"WHERE {where}" if where else ""
+    # Named cursors live inside the current transaction, so the connection
+    # must not be in autocommit mode
+    with conn.cursor(name=f"rag_stream_{uuid.uuid4().hex}") as cur:
+        cur.itersize = chunk_size
+        cur.execute(f"""
+            SELECT cantxt_id, cantxt_content_text
+            FROM te_ai_canonical_data
+            {where_sql}
+        """, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            embeddings = np.asarray(encode([r[1] or "" for r in rows]), dtype=np.float32)
+            scores = query_embs @ embeddings.T
+            for heap, row_scores in zip(heaps, scores):
+                heap.push(rows, row_scores)
+    conn.rollback()
+
+    results = [[(row[0], row[1], float(score)) for row, score in heap.result()] for heap in heaps]
+    return results[0] if single else results
@@ -0,0 +1,162 @@
+import os
+import pickle
+import time
+
+import numpy as np
+from scipy import sparse
+
+from topk import top_k_rows
+
+
+# -----------------------------
+# Persistent TF-IDF index for te_ai_message
+# -----------------------------
+# Layout of the index directory:
+#   vectorizer.pkl   fitted TfidfVectorizer (vocabulary + idf)
+#   matrix.npz       CSR doc matrix, one L2-normalized row per message
+#   ids.npy          msg_id per row
+#   state.npy        [fitted_at, docs_at_fit]
+#
+# New messages are appended by transforming them with the existing
+# vocabulary/idf; the vectorizer is refit over the whole table only once the
+# appended share grows past `refit_ratio` or the fit is older than
+# `refit_after` seconds, so a query is one sparse dot product.
+
+IDS_QUERY = "SELECT msg_id FROM te_ai_message"
+CONTENT_QUERY = "SELECT msg_id, msg_content_text FROM te_ai_message WHERE msg_id = ANY(%s)"
+ALL_QUERY = "SELECT msg_id, msg_content_text FROM te_ai_message ORDER BY msg_id"
+
+
+class TfidfIndex:
+    def __init__(self, path, refit_ratio=0.2, refit_after=24 * 3600):
+        self.path = path
+        self.refit_ratio = refit_ratio
+        self.refit_after = refit_after
+        self.vectorizer = None
+        self.matrix = None
+        self.ids = None
+        self.fitted_at = 0.0
+        self.docs_at_fit = 0
+
+    def __len__(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    # -----------------------------
+    # Load / save
+    # -----------------------------
+    def load(self):
+        if not os.path.exists(self._file("state.npy")):
+            return False
+        with open(self._file("vectorizer.pkl"), "rb") as f:
+            self.vectorizer = pickle.load(f)
+        self.matrix = sparse.load_npz(self._file("matrix.npz")).tocsr()
+        self.ids = np.load(self._file("ids.npy"))
+        fitted_at, docs_at_fit = np.load(self._file("state.npy"))
+        self.fitted_at, self.docs_at_fit = float(fitted_at), int(docs_at_fit)
+        return True
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("vectorizer.pkl.tmp"), "wb") as f:
+            pickle.dump(self.vectorizer, f)
+        with open(self._file("matrix.npz.tmp"), "wb") as f:
+            sparse.save_npz(f, self.matrix)
+        with open(self._file("ids.npy.tmp"), "wb") as f:
+            np.save(f, self.ids, allow_pickle=False)
+        with open(self._file("state.npy.tmp"), "wb") as f:
+            np.save(f, np.array([self.fitted_at, self.docs_at_fit]))
+        # state.npy goes last: load() treats it as the "index complete" marker
+        for name in ("vectorizer.pkl", "matrix.npz", "ids.npy", "state.npy"):
+            os.replace(self._file(name + ".tmp"), self._file(name))
+
+    # -----------------------------
+    # Build / refresh
+    # -----------------------------
+    def fit(self, conn):
+        cur = conn.cursor()
+        cur.execute(ALL_QUERY)
+        rows = cur.fetchall()
+        cur.close()
+        self.fit_rows(rows)
+        self.save()
+        return len(rows)
+
+    def fit_rows(self, rows):
+        # rows: (msg_id, msg_content_text)
+        # Imported here: loading a fitted index only needs the pickled vectorizer
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.vectorizer = TfidfVectorizer(dtype=np.float32)
+        self.matrix = self.vectorizer.fit_transform([r[1] or "" for r in rows]).tocsr()
+        self.ids = np.asarray([r[0] for r in rows])
+        self.fitted_at = time.time()
+        self.docs_at_fit = len(rows)
+
+    def needs_refit(self, pending=0):
+        if self.vectorizer is None:
+            return True
+        if time.time() - self.fitted_at > self.refit_after:
+            return True
+        appended = len(self) + pending - self.docs_at_fit
+        return appended > self.refit_ratio * max(self.docs_at_fit, 1)
+
+    def refresh(self, conn):
+        # Returns the number of rows (re)indexed
+        if self.vectorizer is None:
+            return self.fit(conn)
+
+        cur = conn.cursor()
+        cur.execute(IDS_QUERY)
+        current = [r[0] for r in cur.fetchall()]
+        current_set = set(current)
+        known = set(self.ids.tolist())
+        new_ids = [i for i in current if i not in known]
+
+        if self.needs_refit(len(new_ids)):
+            cur.close()
+            return self.fit(conn)
+
+        keep = np.fromiter((i in current_set for i in self.ids.tolist()), dtype=bool, count=len(self))
+        if not new_ids and keep.all():
+            cur.close()
+            return 0
+
+        matrix, ids = self.matrix[keep], self.ids[keep]
+        if new_ids:
+            cur.execute(CONTENT_QUERY, (new_ids,))
+            rows = cur.fetchall()
+            appended = self.vectorizer.transform([r[1] or "" for r in rows])
+            matrix = sparse.vstack([matrix, appended], format="csr")
+            ids = np.concatenate([ids, np.asarray([r[0] for r in rows], dtype=ids.dtype)])
+        cur.close()
+
+        self.matrix, self.ids = matrix, ids
+        self.save()
+        return len(new_ids)
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def scores(self, query_text):
+        query_vec = self.vectorizer.transform([query_text])
+        # Rows and query are L2-normalized, so the dot product is the cosine
+        return (self.matrix @ query_vec.T).toarray().ravel()
+
+    def search(self, query_text, k=5):
+        return self.search_many([query_text], k=k)[0]
+
+    def search_many(self, query_texts, k=5, max_block=1 << 26):
+        if not len(self):
+            return [[] for _ in query_texts]
+        query_vecs = self.vectorizer.transform(query_texts)
+        step = max(1, max_block // len(self))
+
+        results = []
+        for start in range(0, len(query_texts), step):
+            scores = (query_vecs[start:start + step] @ self.matrix.T).toarray()
+            for idx, values in top_k_rows(scores, k):
+                results.append([(self.ids[i].item(), float(v)) for i, v in zip(idx, values)])
+        return results
@@ -0,0 +1,96 @@
+import heapq
+
+import numpy as np
+
+
+# -----------------------------
+# Top-k selection shared by every scorer
+# -----------------------------
+# argpartition selects the k best in O(n); only those k are then sorted.
+# Scores of -inf (masked out rows) are never returned.
+
+
+def _is_torch(scores):
+    return type(scores).__module__.startswith("torch")
+
+
+def top_k(scores, k):
+    # 1-D scores -> (indices, scores), best first
+    if _is_torch(scores):
+        import torch
+
+        k = min(k, scores.shape[-1])
+        values, indices = torch.topk(scores, k)
+        return _finite(indices.cpu().numpy(), values.cpu().numpy())
+
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), scores[:0]
+    if k < len(scores):
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(len(scores))
+    idx = idx[np.argsort(-scores[idx], kind="stable")]
+    return _finite(idx, scores[idx])
+
+
+def top_k_rows(scores, k):
+    # 2-D [queries, docs] scores -> list of (indices, scores) per row
+    if _is_torch(scores):
+        import torch
+
+        k = min(k, scores.shape[-1])
+        values, indices = torch.topk(scores, k, dim=1)
+        return [_finite(i, v) for i, v in zip(indices.cpu().numpy(), values.cpu().numpy())]
+
+    scores = np.asarray(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return [(np.zeros(0, dtype=np.int64), row[:0]) for row in scores]
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    top_scores = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    idx = np.take_along_axis(idx, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [_finite(i, v) for i, v in zip(idx, top_scores)]
+
+
+def _finite(idx, values):
+    keep = np.isfinite(values)
+    if keep.all():
+        return idx, values
+    return idx[keep], values[keep]
+
+
+class StreamingTopK:
+    # Running top-k over scores that arrive in chunks (e.g. corpus read with a
+    # server-side cursor). Each chunk is reduced to its own top-k with
+    # argpartition first, so the heap only ever sees k items per chunk.
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []  # min-heap of (score, seq, item)
+        self._seq = 0
+
+    def push(self, items, scores):
+        idx, values = top_k(scores, self.k)
+        for i, score in zip(idx.tolist(), values.tolist()):
+            entry = (score, self._seq, items[i])
+            self._seq += 1
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, entry)
+            elif score > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    @property
+    def threshold(self):
+        # Score a new item has to beat to enter the top-k
+        return self._heap[0][0] if len(self._heap) == self.k else -np.inf
+
+    def result(self):
+        # [(item, score)], best first
+        return [(item, score) for score, _, item in sorted(self._heap, key=lambda e: (-e[0], e[1]))]
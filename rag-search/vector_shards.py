@@ -0,0 +1,49 @@
+import threading
+
+from query_cache import LRUCache
+
+
+# -----------------------------
+# Tenant / language partitioned vector shards
+# -----------------------------
+# A shard is the (tenant, lang) slice of the embedding store copied into its
+# own contiguous in-memory matrix (EmbeddingStore.subset), so a tenant query
+# scores only that tenant's rows and never pages in the rest of the memmap.
+# Shards are built on first use and kept in an LRU of `max_shards`, so memory
+# is bounded by the active tenants rather than by the corpus. Either key part
+# may be None ("all tenants" / "all languages"); (None, None) is the full store.
+#
+# clear() after the store was synced; shards are never updated in place.
+
+
+class VectorShards:
+    def __init__(self, store, max_shards=64):
+        self.store = store
+        self._shards = LRUCache(max_shards)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._shards)
+
+    def get(self, tenant_id=None, lang=None):
+        if tenant_id is None and lang is None:
+            return self.store
+        key = (None if tenant_id is None else str(tenant_id), lang)
+        shard = self._shards.get(key)
+        if shard is None:
+            with self._lock:
+                # Another thread may have built it while we waited
+                shard = self._shards.get(key)
+                if shard is None:
+                    shard = self.store.subset(self.store.rows_for(*key))
+                    self._shards.put(key, shard)
+        return shard
+
+    def search(self, query_emb, k=5, tenant_id=None, lang=None):
+        return self.get(tenant_id, lang).search(query_emb, k=k)
+
+    def search_many(self, query_embs, k=5, tenant_id=None, lang=None):
+        return self.get(tenant_id, lang).search_many(query_embs, k=k)
+
+    def clear(self):
+        self._shards.clear()
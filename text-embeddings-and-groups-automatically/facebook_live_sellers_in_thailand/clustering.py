@@ -1,10 +1,196 @@
-RUNS = {}  # maps run_id → { "terms": [...], "vecs": [...] }
+import os
+import threading
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+from threadpoolctl import threadpool_limits
+
+from .models import FinalizeItem
+from .settings import settings
+
+INITIAL_CAPACITY = 1024
+
+
+class RunBuffer:
+    # Terms plus one preallocated float32 [capacity, dim] matrix. The first
+    # append fixes dim; the matrix doubles when full, so appends are a memcpy
+    # into the free rows (amortized O(1) per vector) and vectors() is a view.
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.terms = []
+        self.dim = None
+        self._capacity = capacity
+        self._data = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _reserve(self, size):
+        if self._data is None:
+            self._data = np.empty((max(self._capacity, size), self.dim), dtype=np.float32)
+            return
+        capacity = len(self._data)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:len(self.terms)] = self._data[:len(self.terms)]
+        self._data = grown
+
+    def append(self, terms, vecs):
+        if len(terms) == 0:
+            # An empty batch is a no-op, as before
+            return len(self.terms)
+        vecs = np.asarray(vecs, dtype=np.float32)
+        if vecs.ndim != 2 or len(vecs) != len(terms):
+            raise ValueError(f"expected {len(terms)} vectors, got array of shape {vecs.shape}")
+        if not np.isfinite(vecs).all():
+            raise ValueError("vectors must not contain NaN or inf")
+        with self._lock:
+            if self.dim is None:
+                if vecs.shape[1] == 0:
+                    raise ValueError("vectors must not be empty")
+                self.dim = vecs.shape[1]
+            elif vecs.shape[1] != self.dim:
+                raise ValueError(f"expected {self.dim}-dim vectors for this run, got {vecs.shape[1]}")
+            start = len(self.terms)
+            self._reserve(start + len(vecs))
+            self._data[start:start + len(vecs)] = vecs
+            self.terms.extend(terms)
+            return len(self.terms)
+
+    def vectors(self):
+        # (terms, [n, dim] view); a later append that grows the buffer swaps
+        # in a new matrix, so the view stays valid
+        with self._lock:
+            n = len(self.terms)
+            if self._data is None:
+                return [], np.zeros((0, 0), dtype=np.float32)
+            return self.terms[:n], self._data[:n]
+
+
+RUNS = {}  # maps run_id → RunBuffer
+
+
 def start_run(run_id: str):
-    RUNS[run_id] = {"terms": [], "vecs": []}
+    RUNS[run_id] = RunBuffer()
+
+
+def get_run(run_id: str):
+    try:
+        return RUNS[run_id]
+    except KeyError:
+        raise ValueError(f"unknown run_id: {run_id}, call /start first") from None
+
+
 def append_run(run_id: str, items):
-    # validate run_id exists etc
-    for item in items:
-        RUNS[run_id]["terms"].append(item.term)
-        RUNS[run_id]["vecs"].append(item.vec)
+    return append_vectors(run_id, [item.term for item in items], [item.vec for item in items])
+
+
+def append_vectors(run_id: str, terms, vecs):
+    # vecs: [n, dim] array (e.g. a decoded wire.py payload) or nested lists
+    return get_run(run_id).append(terms, vecs)
+
+
+def normalize_rows(X):
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    if (norms == 0).any():
+        raise ValueError("zero vectors cannot be clustered by cosine similarity")
+    return X / norms
+
+
+def kmeans(X, k):
+    model = KMeans(n_clusters=k, n_init=10, random_state=settings.RANDOM_STATE).fit(X)
+    return model.labels_, model.cluster_centers_
+
+
+def fit_k(X, k, blas_threads):
+    # One sweep candidate; runs in a worker process with its own BLAS/OpenMP
+    # thread budget so parallel jobs don't oversubscribe the cores
+    with threadpool_limits(limits=blas_threads):
+        labels, _ = kmeans(X, k)
+        return labels, k, silhouette_score(X, labels, metric="cosine")
+
+
+def sweep_k(X):
+    # Best (labels, k, silhouette) over K_MIN..K_MAX. Candidates are fitted in
+    # parallel; X (already normalized) is dumped once to shared memory and
+    # memory-mapped read-only by every worker instead of pickled per job.
+    k_min = max(2, settings.K_MIN)
+    k_max = min(settings.K_MAX, len(X) - 1)
+    if k_min > k_max:
+        raise ValueError(f"need at least {k_min + 1} items to cluster, got {len(X)}")
+    ks = range(k_min, k_max + 1)
+    cpus = os.cpu_count() or 1
+    n_jobs = max(1, min(len(ks), settings.N_JOBS or cpus))
+    blas_threads = settings.BLAS_THREADS or max(1, cpus // n_jobs)
+    results = Parallel(n_jobs=n_jobs, backend="loky", max_nbytes="1M", mmap_mode="r")(
+        delayed(fit_k)(X, k, blas_threads) for k in ks
+    )
+    # Highest silhouette, smallest k on ties
+    return max(results, key=lambda r: (r[2], -r[1]))
+
+
+def centroids(X, labels):
+    ids = np.unique(labels)
+    return ids, normalize_rows(np.stack([X[labels == i].mean(axis=0) for i in ids]))
+
+
+def merge_small(X, labels, min_size):
+    # Clusters below min_size are dissolved one at a time, smallest first,
+    # their items moved to the nearest (cosine) remaining centroid
+    labels = labels.copy()
+    while True:
+        ids, counts = np.unique(labels, return_counts=True)
+        if len(ids) < 2 or counts.min() >= min_size:
+            return labels
+        small = ids[counts.argmin()]
+        members = labels == small
+        keep, centers = centroids(X[~members], labels[~members])
+        nearest = (X[members] @ centers.T).argmax(axis=1)
+        labels[members] = keep[nearest]
+
+
+def split_large(X, labels, max_size, min_size):
+    # Clusters above max_size are halved with 2-means until they fit, as long
+    # as both halves keep at least min_size items
+    labels = labels.copy()
+    pending = [i for i, n in zip(*np.unique(labels, return_counts=True)) if n > max_size]
+    next_id = labels.max() + 1
+    while pending:
+        cluster = pending.pop()
+        members = np.flatnonzero(labels == cluster)
+        halves, _ = kmeans(X[members], 2)
+        sizes = np.bincount(halves, minlength=2)
+        if sizes.min() < min_size:
+            continue
+        labels[members[halves == 1]] = next_id
+        pending.extend(i for i, n in ((cluster, sizes[0]), (next_id, sizes[1])) if n > max_size)
+        next_id += 1
+    return labels
+
+
+def cluster(X):
+    # X: [n, dim] raw vectors -> (labels 0..k-1, k, silhouette)
+    X = normalize_rows(X)
+    labels, k, sil = sweep_k(X)
+    adjusted = merge_small(X, labels, settings.MIN_SIZE)
+    if settings.MAX_SIZE:
+        adjusted = split_large(X, adjusted, settings.MAX_SIZE, settings.MIN_SIZE)
+    if not np.array_equal(adjusted, labels):
+        _, labels = np.unique(adjusted, return_inverse=True)
+        k = int(labels.max()) + 1
+        sil = silhouette_score(X, labels, metric="cosine") if k > 1 else 0.0
+    return labels, k, float(sil)
+
+
 def finalize_run(run_id: str):
-    # retrieve terms & vecs, convert to numpy, do clustering, return assignments etc
+    terms, X = get_run(run_id).vectors()
+    if not terms:
+        raise ValueError(f"run {run_id} has no items")
+    labels, chosen_k, silhouette = cluster(X)
+    assignments = [FinalizeItem(term=term, cluster_id=int(label)) for term, label in zip(terms, labels)]
+    return chosen_k, silhouette, assignments
@@ -1,6 +1,13 @@
-from fastapi import FastAPI, HTTPException
-from .models import AppendRequest, FinalizeRequest, FinalizeResponse
-from .clustering import start_run, append_run, finalize_run
+import json
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from .models import AppendRequest, AppendPackedRequest, FinalizeRequest, FinalizeResponse
+from .clustering import start_run, append_run, append_vectors, finalize_run
+from . import wire
 
 app = FastAPI()
 
@@ -9,11 +16,71 @@ def start(run_id: str):
     start_run(run_id)
     return {"ok": True}
 
-@app.post("/append")
-def append(req: AppendRequest):
+def inline_schema(model):
+    # JSON schema with nested models inlined, for openapi_extra (its
+    # "#/definitions" refs would not resolve inside the OpenAPI document)
+    schema = model.schema(ref_template="{model}")
+    definitions = schema.pop("definitions", {})
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(definitions[node["$ref"]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+    return resolve(schema)
+
+BINARY_SCHEMA = {"schema": {"type": "string", "format": "binary"}}
+
+APPEND_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {"oneOf": [inline_schema(AppendRequest), inline_schema(AppendPackedRequest)]},
+            },
+            wire.RAW_CONTENT_TYPE: BINARY_SCHEMA,
+            wire.NPY_CONTENT_TYPE: BINARY_SCHEMA,
+        },
+    },
+}
+
+def append_json(body):
+    # Malformed or invalid JSON bodies get FastAPI's usual 422
+    try:
+        payload = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{"loc": ("body", e.pos), "msg": "JSON decode error",
+                                       "type": "value_error.jsondecode", "ctx": {"error": e.msg}}])
+    model = AppendPackedRequest if isinstance(payload, dict) and "vecs_b64" in payload else AppendRequest
+    try:
+        req = model.parse_obj(payload)
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+    if model is AppendPackedRequest:
+        return append_vectors(req.run_id, *wire.decode_packed(req))
+    return append_run(req.run_id, req.items)
+
+def append_binary(body, content_type, run_id):
+    if not run_id:
+        raise ValueError("run_id query parameter is required for binary payloads")
+    decode = wire.decode_npy if content_type == wire.NPY_CONTENT_TYPE else wire.decode_raw
+    return append_vectors(run_id, *decode(body))
+
+@app.post("/append", openapi_extra=APPEND_BODY)
+async def append(request: Request, run_id: Optional[str] = None):
+    # JSON (AppendRequest / AppendPackedRequest) or a binary payload, see wire.py
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    body = await request.body()
     try:
-        count = append_run(req.run_id, req.items)
+        if content_type in (wire.RAW_CONTENT_TYPE, wire.NPY_CONTENT_TYPE):
+            count = await run_in_threadpool(append_binary, body, content_type, run_id)
+        else:
+            count = await run_in_threadpool(append_json, body)
         return {"ok": True, "count": count}
+    except RequestValidationError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -6,6 +6,11 @@ class AppendItem(BaseModel):
 class AppendRequest(BaseModel):
     run_id: str
     items: List[AppendItem]
+class AppendPackedRequest(BaseModel):
+    run_id: str
+    terms: List[str]
+    dim: int
+    vecs_b64: str
 class FinalizeRequest(BaseModel):
     run_id: str
 class FinalizeItem(BaseModel):
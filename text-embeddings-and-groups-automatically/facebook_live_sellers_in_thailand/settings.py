@@ -5,4 +5,6 @@ class Settings(BaseSettings):
     MIN_SIZE: int = 5
     MAX_SIZE: int | None = None
     RANDOM_STATE: int = 42
+    N_JOBS: int | None = None
+    BLAS_THREADS: int | None = None
 settings = Settings()
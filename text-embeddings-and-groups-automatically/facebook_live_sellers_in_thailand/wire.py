@@ -0,0 +1,77 @@
+import base64
+import io
+import struct
+
+import numpy as np
+
+# Binary /append payloads. Vectors are decoded with np.frombuffer as a view of
+# the request body, so the only copy is RunBuffer.append into the run matrix.
+#
+#   application/octet-stream  uint32 n, uint32 dim (little-endian), then
+#                             n * dim little-endian float32, then the n terms
+#                             as UTF-8, one per line      (?run_id=... query)
+#   application/x-npy         a 2-D float .npy array (float32 is not
+#                             converted), then the terms as above
+#                                                         (?run_id=... query)
+#   application/json          AppendRequest, or AppendPackedRequest with the
+#                             float32 block base64-encoded in vecs_b64
+
+RAW_CONTENT_TYPE = "application/octet-stream"
+NPY_CONTENT_TYPE = "application/x-npy"
+
+HEADER = struct.Struct("<II")
+FLOAT32 = np.dtype("<f4")
+
+
+def read_terms(data, n):
+    terms = data.decode("utf-8").split("\n") if data else []
+    if terms and terms[-1] == "" and len(terms) == n + 1:
+        terms.pop()
+    if len(terms) != n:
+        raise ValueError(f"expected {n} terms after the vectors, got {len(terms)}")
+    return terms
+
+
+def read_vectors(data, n, dim, offset=0):
+    size = n * dim * FLOAT32.itemsize
+    if dim == 0 or len(data) < offset + size:
+        raise ValueError(f"payload too short for {n} x {dim} float32 vectors")
+    return np.frombuffer(data, dtype=FLOAT32, count=n * dim, offset=offset).reshape(n, dim), offset + size
+
+
+def decode_raw(body):
+    if len(body) < HEADER.size:
+        raise ValueError("payload too short for the (n, dim) header")
+    n, dim = HEADER.unpack_from(body)
+    vecs, end = read_vectors(body, n, dim, HEADER.size)
+    return read_terms(body[end:], n), vecs
+
+
+def decode_npy(body):
+    stream = io.BytesIO(body)
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError(f"unsupported .npy format version {version}")
+    if len(shape) != 2 or dtype.kind != "f":
+        raise ValueError(f"expected a 2-D float array, got {dtype} with shape {shape}")
+    n, dim = shape
+    size = n * dim * dtype.itemsize
+    start = stream.tell()
+    if len(body) < start + size:
+        raise ValueError(f"payload too short for {n} x {dim} {dtype} vectors")
+    vecs = np.frombuffer(body, dtype=dtype, count=n * dim, offset=start)
+    vecs = vecs.reshape((dim, n)).T if fortran_order else vecs.reshape(n, dim)
+    return read_terms(body[start + size:], n), vecs
+
+
+def decode_packed(req):
+    data = base64.b64decode(req.vecs_b64, validate=True)
+    n = len(req.terms)
+    if len(data) != n * req.dim * FLOAT32.itemsize:
+        raise ValueError(f"vecs_b64 holds {len(data)} bytes, expected {n} x {req.dim} float32")
+    vecs, _ = read_vectors(data, n, req.dim)
+    return req.terms, vecs